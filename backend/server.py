@@ -1,46 +1,402 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Query
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, IndexModel, ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import OperationFailure, DuplicateKeyError
+from bson import json_util
+from bson.int64 import Int64
+from tickets import render_ticket_pdf
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
 from typing import List, Optional, Dict, Any
 import uuid
+import re
+import time
+import asyncio
+import base64
+import hashlib
+import unicodedata
 from datetime import datetime, timezone, timedelta
 import jwt
 import bcrypt
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.lib.utils import ImageReader
-import qrcode
+from cachetools import TTLCache, LRUCache
 import io
+import csv
+import json
+import zipfile
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, BrokenExecutor
+import multiprocessing
+import bisect
+import random
+import threading
+from contextvars import ContextVar
+from pymongo import monitoring
+import stripe
 from emergentintegrations.payments.stripe.checkout import StripeCheckout, CheckoutSessionResponse, CheckoutStatusResponse, CheckoutSessionRequest
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
-
 # JWT Config
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-this')
 JWT_ALGORITHM = 'HS256'
 JWT_EXPIRATION = 24  # hours
 
+# Password Hashing Config
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+AUTH_POOL_SIZE = int(os.environ.get('AUTH_POOL_SIZE', '4'))
+AUTH_POOL_MAX_PENDING = int(os.environ.get('AUTH_POOL_MAX_PENDING', '64'))
+
+# Ticket Rendering Config
+TICKET_POOL_SIZE = int(os.environ.get('TICKET_POOL_SIZE', '2'))
+TICKET_POOL_MAX_PENDING = int(os.environ.get('TICKET_POOL_MAX_PENDING', '32'))
+
+# Ticket Export Config
+EXPORT_CHUNK_BYTES = int(os.environ.get('EXPORT_CHUNK_BYTES', str(64 * 1024)))
+EXPORT_LINK_TTL = int(os.environ.get('EXPORT_LINK_TTL', '60'))  # seconds
+
+# Ticket Cache Config
+TICKET_CACHE_BYTES = int(os.environ.get('TICKET_CACHE_BYTES', str(64 * 1024 * 1024)))
+TICKET_CACHE_DIR = os.environ.get('TICKET_CACHE_DIR')  # optional on-disk second tier
+TICKET_CACHE_DISK_BYTES = int(os.environ.get('TICKET_CACHE_DISK_BYTES', str(1024 * 1024 * 1024)))
+
+# Seat Hold Config
+SEAT_HOLD_MINUTES = int(os.environ.get('SEAT_HOLD_MINUTES', '15'))
+HOLD_SWEEP_INTERVAL = int(os.environ.get('HOLD_SWEEP_INTERVAL', '30'))  # seconds
+HOLD_SWEEP_BATCH = int(os.environ.get('HOLD_SWEEP_BATCH', '200'))
+
+# Job Queue Config
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '5'))
+JOB_RETRY_DELAY = int(os.environ.get('JOB_RETRY_DELAY', '2'))  # seconds, doubled on each attempt
+JOB_STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', '300'))  # running jobs older than this are retried on startup
+
+# Seat Stream Config
+SEAT_STREAM_KEEPALIVE = int(os.environ.get('SEAT_STREAM_KEEPALIVE', '15'))  # seconds
+SEAT_STREAM_MAX_SUBSCRIBERS = int(os.environ.get('SEAT_STREAM_MAX_SUBSCRIBERS', '10000'))
+SEAT_CHANGE_STREAM = os.environ.get('SEAT_CHANGE_STREAM', 'false').lower() == 'true'
+
+# Pagination Config
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Cache Config
+SEARCH_CACHE_SIZE = int(os.environ.get('SEARCH_CACHE_SIZE', '2048'))
+SEARCH_CACHE_TTL = int(os.environ.get('SEARCH_CACHE_TTL', '60'))  # seconds
+BUS_CACHE_SIZE = int(os.environ.get('BUS_CACHE_SIZE', '4096'))
+BUS_CACHE_TTL = int(os.environ.get('BUS_CACHE_TTL', '60'))  # seconds
+SEAT_MAP_CACHE_TTL = int(os.environ.get('SEAT_MAP_CACHE_TTL', '5'))  # seconds, bounds staleness across workers
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '10000'))
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', '30'))  # seconds
+PAYMENT_STATUS_CACHE_SIZE = int(os.environ.get('PAYMENT_STATUS_CACHE_SIZE', '10000'))
+PAYMENT_STATUS_CACHE_TTL = int(os.environ.get('PAYMENT_STATUS_CACHE_TTL', '3'))  # seconds, non-terminal statuses only
+
 # Stripe Config
 STRIPE_API_KEY = os.environ.get('STRIPE_API_KEY', 'sk_test_emergent')
+STRIPE_CONNECT_TIMEOUT = float(os.environ.get('STRIPE_CONNECT_TIMEOUT', '5'))  # seconds
+STRIPE_READ_TIMEOUT = float(os.environ.get('STRIPE_READ_TIMEOUT', '20'))  # seconds
+STRIPE_CALL_TIMEOUT = float(os.environ.get('STRIPE_CALL_TIMEOUT', '30'))  # seconds, whole call including retries
+STRIPE_MAX_RETRIES = int(os.environ.get('STRIPE_MAX_RETRIES', '2'))
+STRIPE_MAX_CONCURRENCY = int(os.environ.get('STRIPE_MAX_CONCURRENCY', '16'))
+STRIPE_MAX_PENDING = int(os.environ.get('STRIPE_MAX_PENDING', '64'))
+STRIPE_EVENT_RETENTION_DAYS = int(os.environ.get('STRIPE_EVENT_RETENTION_DAYS', '30'))  # Stripe retries for up to 3 days
+
+# Metrics Config
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # optional bearer token required to scrape /api/metrics
+
+# Slow Query Config
+SLOW_QUERY_MS = int(os.environ.get('SLOW_QUERY_MS', '100'))  # 0 disables the slow-query log
+SLOW_QUERY_EXPLAIN_RATE = float(os.environ.get('SLOW_QUERY_EXPLAIN_RATE', '0'))  # share of slow queries explained; 1 in dev
+SLOW_QUERY_EXPLAIN_INTERVAL = int(os.environ.get('SLOW_QUERY_EXPLAIN_INTERVAL', '600'))  # seconds between explains of one shape
 
 security = HTTPBearer()
 
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
 
+# ==================== METRICS ====================
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COMMAND_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+
+class Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+def prometheus_labels(labels: dict) -> str:
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped))
+
+class Metrics:
+    # Request and MongoDB command metrics in Prometheus text format. Per process; Mongo events arrive on
+    # driver threads, so every update takes the lock.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.request_latency = {}
+        self.request_count = {}
+        self.request_commands = {}
+        self.command_latency = {}
+        self.command_failures = {}
+    
+    def observe_request(self, method: str, route: str, status: int, seconds: float, commands: int):
+        with self.lock:
+            self.request_latency.setdefault((method, route), Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.request_commands.setdefault((method, route), Histogram(COMMAND_COUNT_BUCKETS)).observe(commands)
+            key = (method, route, status)
+            self.request_count[key] = self.request_count.get(key, 0) + 1
+    
+    def observe_command(self, collection: str, command: str, seconds: float, failed: bool = False):
+        with self.lock:
+            self.command_latency.setdefault((collection, command), Histogram(LATENCY_BUCKETS)).observe(seconds)
+            if failed:
+                self.command_failures[(collection, command)] = self.command_failures.get((collection, command), 0) + 1
+    
+    def _histogram(self, lines: list, name: str, help: str, label_names: tuple, series: dict):
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} histogram"]
+        for key, histogram in sorted(series.items()):
+            labels = dict(zip(label_names, key))
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{{{prometheus_labels({**labels, 'le': bound})}}} {cumulative}")
+            lines.append(f"{name}_bucket{{{prometheus_labels({**labels, 'le': '+Inf'})}}} {histogram.count}")
+            lines.append(f"{name}_sum{{{prometheus_labels(labels)}}} {histogram.sum}")
+            lines.append(f"{name}_count{{{prometheus_labels(labels)}}} {histogram.count}")
+    
+    def _counter(self, lines: list, name: str, help: str, label_names: tuple, series: dict):
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} counter"]
+        for key, value in sorted(series.items()):
+            lines.append(f"{name}{{{prometheus_labels(dict(zip(label_names, key)))}}} {value}")
+    
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            self._histogram(lines, "http_request_duration_seconds", "Request latency by route template.",
+                            ("method", "route"), self.request_latency)
+            self._counter(lines, "http_requests_total", "Responses by route template and status code.",
+                          ("method", "route", "status"), self.request_count)
+            self._histogram(lines, "http_request_mongo_commands", "MongoDB commands issued per request.",
+                            ("method", "route"), self.request_commands)
+            self._histogram(lines, "mongo_command_duration_seconds", "MongoDB command latency by collection and command.",
+                            ("collection", "command"), self.command_latency)
+            self._counter(lines, "mongo_command_failures_total", "Failed MongoDB commands by collection and command.",
+                          ("collection", "command"), self.command_failures)
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+# Command counter of the request being served. Motor copies the context into its executor threads,
+# so the listener sees the same list object and can count into it.
+request_mongo_commands: ContextVar[Optional[list]] = ContextVar("request_mongo_commands", default=None)
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    def __init__(self):
+        self.started_commands = {}  # request_id -> (collection, database, command) until succeeded/failed
+    
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        collection = event.command.get("collection") if event.command_name == "getMore" else target
+        collection = collection if isinstance(collection, str) else ""
+        self.started_commands[event.request_id] = (collection, event.database_name, event.command if SLOW_QUERY_MS > 0 else None)
+        counter = request_mongo_commands.get()
+        if counter is not None:
+            counter[0] += 1
+    
+    def succeeded(self, event):
+        collection, database, command = self.started_commands.pop(event.request_id, ("", "", None))
+        metrics.observe_command(collection, event.command_name, event.duration_micros / 1e6)
+        if SLOW_QUERY_MS > 0 and event.duration_micros >= SLOW_QUERY_MS * 1000 and command is not None:
+            slow_query_log.record(collection, database, event.command_name, command, event.duration_micros / 1000)
+    
+    def failed(self, event):
+        collection, _, _ = self.started_commands.pop(event.request_id, ("", "", None))
+        metrics.observe_command(collection, event.command_name, event.duration_micros / 1e6, failed=True)
+
+mongo_command_metrics = MongoCommandMetrics()
+
+class RequestMetricsMiddleware:
+    # Plain ASGI rather than @app.middleware("http"): that wraps every response in an extra task group and
+    # stops timing once headers are sent, long before a streamed body (exports, seat streams) is finished
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        commands = [0]
+        token = request_mongo_commands.set(commands)
+        started = time.perf_counter()
+        status = 500
+        recorded = False
+        
+        def record():
+            nonlocal recorded
+            recorded = True
+            # Route templates keep label cardinality bounded; anything unrouted shares one label
+            route = scope.get("route")
+            metrics.observe_request(
+                scope["method"], route.path if route else "unmatched", status, time.perf_counter() - started, commands[0]
+            )
+        
+        async def send_and_time(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                record()
+        
+        try:
+            await self.app(scope, receive, send_and_time)
+        finally:
+            # Errors and client disconnects never send the final body
+            if not recorded:
+                record()
+            request_mongo_commands.reset(token)
+
+app.add_middleware(RequestMetricsMiddleware)
+
+# ==================== SLOW QUERY LOG ====================
+
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "findAndModify", "update", "delete"}
+EXPLAIN_DROPPED_FIELDS = {"lsid", "txnNumber", "startTransaction", "autocommit", "readConcern", "writeConcern"}
+
+def query_shape(value):
+    # Field names and operators with values replaced by their type, so the same query groups together
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if value and all(isinstance(item, dict) for item in value):
+            return [query_shape(item) for item in value]
+        return [query_shape(value[0])] if value else []
+    if isinstance(value, re.Pattern) or type(value).__name__ == "Regex":
+        return "regex"
+    return type(value).__name__
+
+def command_shape(command: dict) -> dict:
+    shape = {}
+    if "filter" in command:
+        shape["filter"] = query_shape(command["filter"])
+    if "query" in command:
+        shape["filter"] = query_shape(command["query"])
+    if command.get("updates"):
+        shape["filter"] = query_shape(command["updates"][0].get("q", {}))
+    if command.get("deletes"):
+        shape["filter"] = query_shape(command["deletes"][0].get("q", {}))
+    if "sort" in command:
+        shape["sort"] = dict(command["sort"])
+    if "pipeline" in command:
+        shape["pipeline"] = [
+            {stage: query_shape(body) if stage == "$match" else "..." for stage, body in step.items()}
+            for step in command["pipeline"]
+        ]
+    return shape
+
+def plan_stages(plan: dict) -> List[str]:
+    # Winning plan as a flat list of stages, root first, with the index used by each scan
+    stages = []
+    pending = [plan]
+    while pending:
+        node = pending.pop(0)
+        if not isinstance(node, dict):
+            continue
+        if "stage" in node:
+            stages.append(f"{node['stage']}({node['indexName']})" if "indexName" in node else node['stage'])
+        pending.extend(node.get(key) for key in ("inputStage", "queryPlan") if key in node)
+        pending.extend(node.get("inputStages", []))
+    return stages
+
+def winning_plans(explain: dict) -> List[dict]:
+    # find/count/etc. report queryPlanner at the top; aggregations nest it under their cursor stage
+    found = []
+    pending = [explain]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, dict):
+            if "winningPlan" in node:
+                found.append(node["winningPlan"])
+            else:
+                pending.extend(node.values())
+        elif isinstance(node, list):
+            pending.extend(node)
+    return found
+
+class SlowQueryLog:
+    # Fed from driver threads by the command listener; explains are scheduled onto the event loop
+    def __init__(self):
+        self.loop = None
+        self.explained = TTLCache(maxsize=1024, ttl=SLOW_QUERY_EXPLAIN_INTERVAL)
+        self.slow = 0
+        self.collscans = 0
+    
+    def start(self, loop):
+        self.loop = loop
+    
+    def record(self, collection: str, database: str, command_name: str, command: dict, duration_ms: float):
+        self.slow += 1
+        shape = command_shape(command)
+        logger.warning(
+            f"Slow query: {command_name} on {collection} took {duration_ms:.1f}ms, shape={json_util.dumps(shape)}"
+        )
+        if (
+            self.loop and command_name in EXPLAINABLE_COMMANDS and SLOW_QUERY_EXPLAIN_RATE > 0
+            and random.random() < SLOW_QUERY_EXPLAIN_RATE
+        ):
+            asyncio.run_coroutine_threadsafe(self.explain(collection, database, command_name, command, shape), self.loop)
+    
+    async def explain(self, collection: str, database: str, command_name: str, command: dict, shape: dict):
+        key = (collection, command_name, json_util.dumps(shape))
+        if key in self.explained:
+            return
+        self.explained[key] = True
+        
+        explained = {k: v for k, v in command.items() if not k.startswith("$") and k not in EXPLAIN_DROPPED_FIELDS}
+        try:
+            result = await client[database].command({"explain": explained, "verbosity": "queryPlanner"})
+        except Exception as e:
+            logger.warning(f"Could not explain slow {command_name} on {collection}: {e}")
+            return
+        
+        for plan in winning_plans(result):
+            stages = plan_stages(plan)
+            if "COLLSCAN" in stages:
+                self.collscans += 1
+                logger.error(f"COLLSCAN: {command_name} on {collection} scans the whole collection, shape={json_util.dumps(shape)}")
+            logger.warning(f"Slow query plan: {command_name} on {collection}: {' <- '.join(stages)}")
+    
+    def stats(self) -> dict:
+        return {
+            "threshold_ms": SLOW_QUERY_MS,
+            "explain_rate": SLOW_QUERY_EXPLAIN_RATE,
+            "slow": self.slow,
+            "collscans": self.collscans
+        }
+
+slow_query_log = SlowQueryLog()
+
+# MongoDB connection
+mongo_url = os.environ['MONGO_URL']
+client = AsyncIOMotorClient(mongo_url, event_listeners=[mongo_command_metrics])
+db = client[os.environ['DB_NAME']]
+
 # ==================== MODELS ====================
 
 class User(BaseModel):
@@ -81,6 +437,12 @@ class Bus(BaseModel):
     price: float
     amenities: List[str] = []
     bus_type: str = "Seater"  # Seater, Sleeper, AC, Non-AC
+    departure_date: Optional[str] = None  # YYYY-MM-DD, None for a daily service
+    departure_at: Optional[datetime] = None
+    route_from_key: str = ""
+    route_to_key: str = ""
+    seat_words: List[int] = []  # occupancy bitmap, SEAT_WORD_BITS seats per word
+    seat_version: int = 0  # bumped on every seat change, used as the seat map ETag
     created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
 
 class BusCreate(BaseModel):
@@ -93,6 +455,7 @@ class BusCreate(BaseModel):
     price: float
     amenities: List[str] = []
     bus_type: str = "Seater"
+    departure_date: Optional[str] = None
 
 class Booking(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -102,9 +465,10 @@ class Booking(BaseModel):
     seats: List[int]
     total_amount: float
     booking_date: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
-    status: str = "pending"  # pending, confirmed, cancelled
+    status: str = "pending"  # pending, confirmed, cancelled, expired
     payment_status: str = "pending"  # pending, completed, failed
     session_id: Optional[str] = None
+    hold_expires_at: Optional[datetime] = None
     passenger_name: str
     passenger_email: str
     passenger_phone: str
@@ -129,10 +493,1184 @@ class PaymentTransaction(BaseModel):
     metadata: Dict[str, Any] = {}
     created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
 
+# ==================== DATABASE INDEXES ====================
+
+# Every hot lookup key, reconciled against the live collections on startup
+REQUIRED_INDEXES = {
+    "users": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("email", ASCENDING)], unique=True),
+        IndexModel([("role", ASCENDING)]),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "buses": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("route_from_key", ASCENDING), ("route_to_key", ASCENDING), ("departure_at", ASCENDING)]),
+        IndexModel([("route_to_key", ASCENDING), ("departure_at", ASCENDING)]),
+        IndexModel([("departure_at", ASCENDING), ("id", ASCENDING)]),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "bookings": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("user_id", ASCENDING), ("booking_date", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("bus_id", ASCENDING)]),
+        IndexModel([("status", ASCENDING)]),
+        IndexModel([("payment_status", ASCENDING)]),
+        IndexModel([("booking_date", DESCENDING), ("id", DESCENDING)]),
+        # Only pending bookings are indexed, so the sweeper's scan is proportional to live holds
+        IndexModel([("hold_expires_at", ASCENDING)], partialFilterExpression={"status": "pending"}),
+    ],
+    "payment_transactions": [
+        IndexModel([("session_id", ASCENDING)], unique=True),
+        IndexModel([("booking_id", ASCENDING)]),
+    ],
+    "booking_rollups": [
+        IndexModel([("day", ASCENDING), ("bus_id", ASCENDING)], unique=True),
+        IndexModel([("bus_id", ASCENDING), ("day", ASCENDING)]),
+    ],
+    "stripe_events": [
+        IndexModel([("event_id", ASCENDING)], unique=True),
+        IndexModel([("received_at", ASCENDING)], expireAfterSeconds=STRIPE_EVENT_RETENTION_DAYS * 86400),
+    ],
+    "jobs": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)]),
+    ],
+}
+
+async def ensure_indexes() -> dict:
+    report = {}
+    for collection_name, indexes in REQUIRED_INDEXES.items():
+        collection = db[collection_name]
+        # One call per index so a conflict (e.g. duplicate data under a unique key) doesn't block the rest
+        for index in indexes:
+            try:
+                await collection.create_indexes([index])
+            except OperationFailure as e:
+                logging.error(f"Failed to create index {index.document['name']} on {collection_name}: {e}")
+        
+        existing = set((await collection.index_information()).keys()) - {"_id_"}
+        declared = {index.document['name'] for index in indexes}
+        report[collection_name] = {
+            "missing": sorted(declared - existing),
+            "extra": sorted(existing - declared)
+        }
+        if report[collection_name]["missing"]:
+            logging.warning(f"Missing indexes on {collection_name}: {report[collection_name]['missing']}")
+        if report[collection_name]["extra"]:
+            logging.warning(f"Undeclared indexes on {collection_name}: {report[collection_name]['extra']}")
+    return report
+
+# ==================== CATALOGUE HELPERS ====================
+
+def normalize_city(name: str) -> str:
+    # Casefold, strip accents and collapse whitespace so "São  Paulo" matches "sao paulo"
+    decomposed = unicodedata.normalize('NFKD', name)
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(stripped.casefold().split())
+
+def route_keys(route_from: str, route_to: str) -> dict:
+    return {
+        "route_from_key": normalize_city(route_from),
+        "route_to_key": normalize_city(route_to)
+    }
+
+# Bus fields that only exist for the server's own queries (seat bitmap, normalized route keys)
+BUS_INTERNAL_FIELDS = {"seat_words", "seat_version", "route_from_key", "route_to_key"}
+BUS_PROJECTION = {"_id": 0, **{field: 0 for field in BUS_INTERNAL_FIELDS}}
+
+def city_key_filter(value: str) -> dict:
+    # Anchored, case-sensitive prefix on the normalized key stays an index range scan
+    return {"$regex": f"^{re.escape(normalize_city(value))}"}
+
+def parse_departure(departure_date: Optional[str], departure_time: str) -> Optional[datetime]:
+    # departure_time is either a full ISO datetime or an HH:MM time on departure_date
+    try:
+        departure_at = datetime.fromisoformat(departure_time)
+    except ValueError:
+        if not departure_date:
+            return None
+        try:
+            departure_at = datetime.fromisoformat(f"{departure_date}T{departure_time}")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid departure date or time")
+    if departure_at.tzinfo:
+        departure_at = departure_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return departure_at
+
+def departure_window_filter(date: str, days: int) -> dict:
+    try:
+        day = datetime.strptime(date, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date, expected YYYY-MM-DD")
+    return {"$or": [
+        {"departure_at": {"$gte": day - timedelta(days=days), "$lt": day + timedelta(days=days + 1)}},
+        # Buses without a departure date run every day
+        {"departure_at": None}
+    ]}
+
+# ==================== PAGINATION ====================
+
+def encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json_util.dumps(values).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor: str, size: int) -> list:
+    try:
+        values = json_util.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+def after_value(field: str, direction: int, value) -> dict:
+    # Null sorts before every other value; $gt/$lt never match across types, so spell out null handling
+    if direction == ASCENDING:
+        return {field: {"$ne": None}} if value is None else {field: {"$gt": value}}
+    if value is None:
+        return {field: {"$in": []}}
+    return {"$or": [{field: {"$lt": value}}, {field: None}]}
+
+def keyset_filter(sort: list, values: list) -> dict:
+    # (a, b) > (x, y)  <=>  a > x OR (a == x AND b > y)
+    branches = []
+    for i, (field, direction) in enumerate(sort):
+        equal = {sort[j][0]: values[j] for j in range(i)}
+        branches.append({**equal, **after_value(field, direction, values[i])})
+    return {"$or": branches}
+
+async def paginate(collection, query: dict, projection: dict, sort: list, cursor: Optional[str], limit: int) -> dict:
+    # sort must end on a unique field so every page boundary is unambiguous
+    if cursor:
+        query = {"$and": [query, keyset_filter(sort, decode_cursor(cursor, len(sort)))]}
+    
+    items = await collection.find(query, projection).sort(sort).limit(limit + 1).to_list(limit + 1)
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor([items[-1].get(field) for field, _ in sort])
+    
+    return {"items": items, "next_cursor": next_cursor}
+
+# ==================== BOOKING HELPERS ====================
+
+async def fetch_by_ids(collection, ids: set, projection: dict) -> dict:
+    if not ids:
+        return {}
+    docs = await collection.find({"id": {"$in": list(ids)}}, projection).to_list(len(ids))
+    return {doc['id']: doc for doc in docs}
+
+async def attach_details(bookings: list, include_users: bool = False) -> list:
+    # One $in query per referenced collection instead of one find_one per booking
+    lookups = [fetch_by_ids(db.buses, {b['bus_id'] for b in bookings}, BUS_PROJECTION)]
+    if include_users:
+        lookups.append(fetch_by_ids(db.users, {b['user_id'] for b in bookings}, {"_id": 0, "password": 0}))
+    results = await asyncio.gather(*lookups)
+    
+    for booking in bookings:
+        booking['bus_details'] = results[0].get(booking['bus_id'])
+        if include_users:
+            booking['user_details'] = results[1].get(booking['user_id'])
+    return bookings
+
+# ==================== WORKER POOLS ====================
+
+class BoundedExecutor:
+    # Runs blocking work off the event loop and sheds load once max_pending calls are queued or running
+    def __init__(self, name: str, factory, max_pending: int, retry_after: int = 1):
+        self.name = name
+        self.factory = factory
+        self.executor = factory()
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.restarts = 0
+        self.busy_seconds = 0.0
+    
+    def restart(self, broken):
+        # A pool whose worker died stays broken forever; only the first caller to notice replaces it
+        if self.executor is broken:
+            logger.error(f"{self.name} pool broke, starting a new one")
+            self.executor = self.factory()
+            self.restarts += 1
+            broken.shutdown(wait=False, cancel_futures=True)
+    
+    async def submit(self, fn, *args):
+        executor = self.executor
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        except BrokenExecutor:
+            self.restart(executor)
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+    
+    async def run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Server busy, please retry",
+                headers={"Retry-After": str(self.retry_after)}
+            )
+        
+        self.pending += 1
+        started = time.perf_counter()
+        try:
+            result = await self.submit(fn, *args)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+            self.busy_seconds += time.perf_counter() - started
+        self.completed += 1
+        return result
+    
+    def stats(self) -> dict:
+        finished = self.completed + self.failed
+        return {
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "restarts": self.restarts,
+            "avg_ms": round(self.busy_seconds * 1000 / finished, 3) if finished else 0.0
+        }
+    
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+auth_pool = BoundedExecutor(
+    "auth", lambda: ThreadPoolExecutor(max_workers=AUTH_POOL_SIZE, thread_name_prefix="bcrypt"), AUTH_POOL_MAX_PENDING
+)
+
+# ==================== TICKET RENDERING ====================
+
+def ticket_worker_context():
+    # Workers come from a forkserver rather than fork(): forking this process copies the event loop,
+    # Mongo monitor threads and any lock another thread happens to hold, which can deadlock the child.
+    # They unpickle tickets.render_ticket_pdf, so they import that module and never this one.
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(["tickets"])
+    return context
+
+ticket_pool = BoundedExecutor(
+    "tickets",
+    lambda: ProcessPoolExecutor(max_workers=TICKET_POOL_SIZE, mp_context=ticket_worker_context()),
+    TICKET_POOL_MAX_PENDING,
+    retry_after=2
+)
+
+def ticket_fingerprint(booking: dict, bus: dict) -> str:
+    # Hash of exactly what render_ticket_pdf prints; any change yields a new key and ETag
+    printed = [
+        booking['id'], booking['passenger_name'], booking['passenger_email'], booking['passenger_phone'],
+        bus['bus_number'], bus['route_from'], bus['route_to'], bus['departure_time'], bus['arrival_time'],
+        booking['seats'], booking['total_amount'], booking['booking_date'][:10], booking['status']
+    ]
+    return hashlib.sha256(json.dumps(printed).encode('utf-8')).hexdigest()[:32]
+
+class TicketCache:
+    # Rendered PDFs keyed by (bus id, booking id, fingerprint), evicted LRU by total bytes, optionally backed by disk.
+    # Edits change the fingerprint, so stale entries are never served; invalidation only frees their space early.
+    def __init__(self, max_bytes: int, directory: Optional[str] = None, max_disk_bytes: int = 0):
+        self.entries = LRUCache(maxsize=max_bytes, getsizeof=len)
+        self.directory = Path(directory) if directory else None
+        self.max_disk_bytes = max_disk_bytes
+        # Disk files by "{bus}-{booking}" prefix (one fingerprint each), least recently used first
+        self.files = OrderedDict()
+        self.disk_bytes = 0
+        if self.directory:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            for path in sorted(self.directory.glob("*.pdf"), key=lambda path: path.stat().st_mtime):
+                self._track(path)
+            self._evict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+    
+    def _path(self, key: tuple) -> Path:
+        return self.directory / f"{'-'.join(key)}.pdf"
+    
+    def _track(self, path: Path):
+        # A booking's older fingerprint can never be served again, so it is deleted as soon as a newer one lands
+        prefix = path.stem.rsplit('-', 1)[0]
+        previous = self.files.get(prefix)
+        if previous and previous[0] != path:
+            self._discard(prefix)
+        elif previous:
+            self.disk_bytes -= previous[1]
+        self.files[prefix] = (path, path.stat().st_size)
+        self.files.move_to_end(prefix)
+        self.disk_bytes += self.files[prefix][1]
+    
+    def _discard(self, prefix: str):
+        path, size = self.files.pop(prefix)
+        self.disk_bytes -= size
+        path.unlink(missing_ok=True)
+    
+    def _evict(self):
+        while self.disk_bytes > self.max_disk_bytes and self.files:
+            self._discard(next(iter(self.files)))
+    
+    async def get(self, booking: dict, fingerprint: str) -> Optional[bytes]:
+        key = (booking['bus_id'], booking['id'], fingerprint)
+        pdf = self.entries.get(key)
+        if pdf is not None:
+            self.hits += 1
+            return pdf
+        if self.directory:
+            path = self._path(key)
+            if path.exists():
+                pdf = await asyncio.to_thread(path.read_bytes)
+                if len(pdf) <= self.entries.maxsize:
+                    self.entries[key] = pdf
+                prefix = path.stem.rsplit('-', 1)[0]
+                if prefix in self.files:
+                    self.files.move_to_end(prefix)
+                self.disk_hits += 1
+                return pdf
+        self.misses += 1
+        return None
+    
+    async def put(self, booking: dict, fingerprint: str, pdf: bytes):
+        key = (booking['bus_id'], booking['id'], fingerprint)
+        if len(pdf) <= self.entries.maxsize:
+            self.entries[key] = pdf
+        if self.directory and len(pdf) <= self.max_disk_bytes:
+            path = self._path(key)
+            await asyncio.to_thread(path.write_bytes, pdf)
+            self._track(path)
+            self._evict()
+    
+    def invalidate(self, bus_id: str, booking_id: str = "*"):
+        for key in [key for key in list(self.entries.keys()) if key[0] == bus_id and booking_id in ("*", key[1])]:
+            self.entries.pop(key, None)
+        if self.directory:
+            for prefix in [prefix for prefix in self.files if prefix.startswith(f"{bus_id}-") and booking_id in ("*", prefix[len(bus_id) + 1:])]:
+                self._discard(prefix)
+            for path in self.directory.glob(f"{bus_id}-{booking_id}-*.pdf"):
+                path.unlink(missing_ok=True)
+    
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "size": len(self.entries),
+            "bytes": self.entries.currsize,
+            "max_bytes": self.entries.maxsize,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "disk_files": len(self.files),
+            "disk_bytes": self.disk_bytes,
+            "max_disk_bytes": self.max_disk_bytes,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0
+        }
+
+ticket_cache = TicketCache(TICKET_CACHE_BYTES, TICKET_CACHE_DIR, TICKET_CACHE_DISK_BYTES)
+
+async def load_ticket(booking: dict, bus: dict, fingerprint: Optional[str] = None) -> bytes:
+    fingerprint = fingerprint or ticket_fingerprint(booking, bus)
+    pdf = await ticket_cache.get(booking, fingerprint)
+    if pdf is None:
+        pdf = await ticket_pool.run(render_ticket_pdf, booking, bus)
+        await ticket_cache.put(booking, fingerprint, pdf)
+    return pdf
+
+# ==================== TICKET EXPORT ====================
+
+MANIFEST_COLUMNS = ["booking_id", "passenger_name", "passenger_email", "passenger_phone", "seats", "total_amount", "booking_date"]
+
+class ZipStream:
+    # Write-only sink for zipfile. Having no tell()/seek() makes zipfile emit data descriptors instead of
+    # seeking back, so finished bytes can be handed to the client as soon as they are written.
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+    
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        return data
+
+def export_bookings(bus_id: str):
+    return db.bookings.find({"bus_id": bus_id, "status": "confirmed"}, {"_id": 0}).sort("booking_date", ASCENDING)
+
+async def render_for_export(booking: dict, bus: dict) -> bytes:
+    # An export must not abort halfway because interactive downloads briefly saturated the pool
+    while True:
+        try:
+            return await load_ticket(booking, bus)
+        except HTTPException as e:
+            if e.status_code != 503:
+                raise
+            await asyncio.sleep(ticket_pool.retry_after)
+
+async def export_tickets(bus: dict):
+    # Keeps up to TICKET_POOL_SIZE renders in flight while yielding tickets in cursor order
+    in_flight = deque()
+    try:
+        async for booking in export_bookings(bus['id']):
+            in_flight.append((booking, asyncio.ensure_future(render_for_export(booking, bus))))
+            if len(in_flight) >= TICKET_POOL_SIZE:
+                booking, task = in_flight.popleft()
+                yield booking, await task
+        while in_flight:
+            booking, task = in_flight.popleft()
+            yield booking, await task
+    finally:
+        for _, task in in_flight:
+            task.cancel()
+
+async def stream_bus_export(bus: dict):
+    # One cursor pass: tickets are streamed as they render and manifest.csv is appended last from the rows
+    # collected along the way, which stay small next to the PDFs
+    sink = ZipStream()
+    archive = zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED)
+    manifest = io.StringIO()
+    writer = csv.writer(manifest)
+    writer.writerow(MANIFEST_COLUMNS)
+    
+    async for booking, pdf in export_tickets(bus):
+        archive.writestr(f"tickets/ticket_{booking['id']}.pdf", pdf)
+        writer.writerow([
+            booking['id'], booking['passenger_name'], booking['passenger_email'], booking['passenger_phone'],
+            " ".join(map(str, sorted(booking['seats']))), f"{booking['total_amount']:.2f}", booking['booking_date'][:10]
+        ])
+        if sink.size >= EXPORT_CHUNK_BYTES:
+            yield sink.drain()
+    
+    archive.writestr("manifest.csv", manifest.getvalue())
+    archive.close()
+    yield sink.drain()
+
+# ==================== CACHES ====================
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match", "")
+    return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+
+class CountingCache:
+    # LRU + TTL cache with hit/miss counters. Per worker; the TTL bounds staleness across workers.
+    def __init__(self, maxsize: int, ttl: int):
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.load_seconds = 0.0
+    
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+    
+    def set(self, key, value):
+        self.entries[key] = value
+    
+    def record_load(self, seconds: float):
+        # Time spent fetching on a miss; each hit saves roughly the average of these
+        self.loads += 1
+        self.load_seconds += seconds
+    
+    def pop(self, key):
+        self.entries.pop(key, None)
+    
+    def discard_where(self, predicate):
+        for key in [key for key, value in list(self.entries.items()) if predicate(key, value)]:
+            self.entries.pop(key, None)
+    
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        avg_load_ms = self.load_seconds * 1000 / self.loads if self.loads else 0.0
+        return {
+            "size": len(self.entries),
+            "maxsize": self.entries.maxsize,
+            "ttl": self.entries.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "avg_load_ms": round(avg_load_ms, 3),
+            "estimated_saved_ms": round(avg_load_ms * self.hits, 1)
+        }
+
+search_cache = CountingCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+bus_cache = CountingCache(BUS_CACHE_SIZE, BUS_CACHE_TTL)
+user_cache = CountingCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+seat_map_cache = CountingCache(BUS_CACHE_SIZE, SEAT_MAP_CACHE_TTL)
+payment_status_cache = CountingCache(PAYMENT_STATUS_CACHE_SIZE, PAYMENT_STATUS_CACHE_TTL)
+
+def search_cache_key(route_from: Optional[str], route_to: Optional[str], date: Optional[str], days: int,
+                     cursor: Optional[str], limit: int) -> tuple:
+    return (
+        normalize_city(route_from) if route_from else None,
+        normalize_city(route_to) if route_to else None,
+        date, days, cursor, limit
+    )
+
+def search_matches_bus(key: tuple, bus: dict) -> bool:
+    # Mirrors the search filter, so a catalogue write only drops the result pages it could appear in
+    from_key, to_key, date, days = key[:4]
+    if from_key is not None and not bus.get('route_from_key', '').startswith(from_key):
+        return False
+    if to_key is not None and not bus.get('route_to_key', '').startswith(to_key):
+        return False
+    if date and bus.get('departure_at'):
+        day = datetime.strptime(date, "%Y-%m-%d")
+        return day - timedelta(days=days) <= bus['departure_at'] < day + timedelta(days=days + 1)
+    return True
+
+class InvalidationClock:
+    # A cache fill that read the database before an invalidation must not be stored after it. Every
+    # invalidation ticks the clock and stamps the bus (and, for catalogue writes, the whole catalogue);
+    # a fill remembers the tick it started at and skips the set if anything it depends on was stamped since.
+    def __init__(self):
+        self.tick = 0
+        self.catalogue = 0
+        self.buses = {}
+    
+    def invalidate(self, bus_id: str, catalogue: bool = False):
+        self.tick += 1
+        self.buses[bus_id] = self.tick
+        if catalogue:
+            self.catalogue = self.tick
+    
+    def changed_since(self, started: int, bus_ids=(), catalogue: bool = False) -> bool:
+        if catalogue and self.catalogue > started:
+            return True
+        return any(self.buses.get(bus_id, 0) > started for bus_id in bus_ids)
+
+cache_clock = InvalidationClock()
+
+def invalidate_bus(*buses: dict):
+    # Catalogue writes: pass the bus as it was and as it is now
+    for bus in buses:
+        cache_clock.invalidate(bus['id'], catalogue=True)
+        bus_cache.pop(bus['id'])
+        seat_map_cache.pop(bus['id'])
+        search_cache.discard_where(lambda key, page: search_matches_bus(key, bus))
+
+def invalidate_bus_seats(bus_id: str):
+    # Seat counts only change for pages that already list the bus
+    cache_clock.invalidate(bus_id)
+    bus_cache.pop(bus_id)
+    search_cache.discard_where(lambda key, page: any(item['id'] == bus_id for item in page['items']))
+
+def cache_user(user: dict):
+    # Logins and registrations refresh the entry, so role changes apply on the next login at the latest
+    user_cache.set(user['id'], {k: v for k, v in user.items() if k not in ("_id", "password")})
+
+# ==================== SEAT INVENTORY ====================
+
+# Seat n lives in bit (n - 1) % 63 of word (n - 1) // 63; 63 keeps every word a positive int64
+SEAT_WORD_BITS = 63
+SEAT_WORD_MASK = (1 << SEAT_WORD_BITS) - 1
+
+def empty_seat_words(total_seats: int) -> List[Int64]:
+    return [Int64(0)] * (-(-total_seats // SEAT_WORD_BITS))
+
+def seat_masks(seats: List[int]) -> Dict[int, int]:
+    masks = {}
+    for seat in seats:
+        word, bit = divmod(seat - 1, SEAT_WORD_BITS)
+        masks[word] = masks.get(word, 0) | (1 << bit)
+    return masks
+
+def occupied_seats(seat_words: List[int]) -> List[int]:
+    return [
+        word * SEAT_WORD_BITS + bit + 1
+        for word, value in enumerate(seat_words)
+        for bit in range(SEAT_WORD_BITS)
+        if value >> bit & 1
+    ]
+
+SEAT_MAP_PROJECTION = {"_id": 0, "id": 1, "total_seats": 1, "available_seats": 1, "seat_words": 1, "seat_version": 1}
+
+def seat_map_snapshot(bus: dict) -> dict:
+    # Seat n is bit (n - 1) % 8 of byte (n - 1) // 8, base64-encoded
+    occupancy = 0
+    for word, value in enumerate(bus.get('seat_words', [])):
+        occupancy |= int(value) << (word * SEAT_WORD_BITS)
+    bitmap = occupancy.to_bytes(-(-bus['total_seats'] // 8), 'little')
+    version = bus.get('seat_version', 0)
+    return {
+        "etag": f'"{bus["id"]}-{version}"',
+        "body": {
+            "bus_id": bus['id'],
+            "total_seats": bus['total_seats'],
+            "available_seats": bus['available_seats'],
+            "version": version,
+            "occupancy": base64.b64encode(bitmap).decode('ascii')
+        }
+    }
+
+class SeatSubscription:
+    # Holds only the newest seat map, so a slow client skips versions instead of queueing them
+    def __init__(self):
+        self.event = asyncio.Event()
+        self.latest = None
+
+class SeatEventHub:
+    # In-process fan-out of seat map changes to the SSE streams open on this worker
+    def __init__(self):
+        self.subscribers: Dict[str, set] = {}
+        self.count = 0
+        self.published = 0
+    
+    def subscribe(self, bus_id: str) -> SeatSubscription:
+        if self.count >= SEAT_STREAM_MAX_SUBSCRIBERS:
+            raise HTTPException(status_code=503, detail="Too many open seat streams", headers={"Retry-After": "5"})
+        subscription = SeatSubscription()
+        self.subscribers.setdefault(bus_id, set()).add(subscription)
+        self.count += 1
+        return subscription
+    
+    def unsubscribe(self, bus_id: str, subscription: SeatSubscription):
+        subscribers = self.subscribers.get(bus_id)
+        if subscribers and subscription in subscribers:
+            subscribers.discard(subscription)
+            self.count -= 1
+            if not subscribers:
+                del self.subscribers[bus_id]
+    
+    def publish(self, bus_id: str, seat_map: dict):
+        for subscription in self.subscribers.get(bus_id, ()):
+            if subscription.latest is None or subscription.latest['version'] < seat_map['version']:
+                subscription.latest = seat_map
+                subscription.event.set()
+        self.published += 1
+    
+    def stats(self) -> dict:
+        return {"subscribers": self.count, "buses": len(self.subscribers), "published": self.published}
+
+seat_events = SeatEventHub()
+
+def seats_changed(bus: dict):
+    # Writers already hold the new seat state, so the next seat map read is served without a query
+    invalidate_bus_seats(bus['id'])
+    snapshot = seat_map_snapshot(bus)
+    cache_seat_map(snapshot)
+    seat_events.publish(bus['id'], snapshot["body"])
+
+def cache_seat_map(snapshot: dict):
+    # Seat writers and loads can finish out of order; never replace a newer map with an older one
+    current = seat_map_cache.entries.get(snapshot["body"]["bus_id"])
+    if current is None or current["body"]["version"] < snapshot["body"]["version"]:
+        seat_map_cache.set(snapshot["body"]["bus_id"], snapshot)
+
+async def load_seat_map(bus_id: str) -> dict:
+    snapshot = seat_map_cache.get(bus_id)
+    if snapshot is None:
+        started = cache_clock.tick
+        bus = await db.buses.find_one({"id": bus_id}, SEAT_MAP_PROJECTION)
+        if not bus:
+            raise HTTPException(status_code=404, detail="Bus not found")
+        snapshot = seat_map_snapshot(bus)
+        if not cache_clock.changed_since(started, [bus_id]):
+            cache_seat_map(snapshot)
+    return snapshot
+
+async def watch_seat_changes():
+    # Optional (needs a replica set): relay seat changes made by other workers to this worker's streams
+    pipeline = [{"$match": {
+        "operationType": "update",
+        "updateDescription.updatedFields.seat_version": {"$exists": True}
+    }}]
+    while True:
+        try:
+            async with db.buses.watch(pipeline, full_document="updateLookup") as stream:
+                async for change in stream:
+                    bus = change.get("fullDocument")
+                    if bus:
+                        seats_changed(bus)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Seat change stream failed, restarting")
+            await asyncio.sleep(5)
+
+async def claim_seats(bus_id: str, seats: List[int], session=None) -> Optional[dict]:
+    # One conditional update: matches only if every requested bit is clear, then sets them all
+    masks = seat_masks(seats)
+    query = {"id": bus_id, "total_seats": {"$gte": max(seats)}}
+    for word, mask in masks.items():
+        query[f"seat_words.{word}"] = {"$bitsAllClear": Int64(mask)}
+    
+    bus = await db.buses.find_one_and_update(
+        query,
+        {
+            "$bit": {f"seat_words.{word}": {"or": Int64(mask)} for word, mask in masks.items()},
+            "$inc": {"available_seats": -len(seats), "seat_version": 1}
+        },
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+        session=session
+    )
+    # Inside a transaction the caller publishes after commit
+    if bus and session is None:
+        seats_changed(bus)
+    return bus
+
+async def release_seats(bus_id: str, seats: List[int]) -> bool:
+    # Only releases seats that are still held, so a repeated release can't free someone else's seats
+    masks = seat_masks(seats)
+    query = {"id": bus_id}
+    for word, mask in masks.items():
+        query[f"seat_words.{word}"] = {"$bitsAllSet": Int64(mask)}
+    
+    bus = await db.buses.find_one_and_update(
+        query,
+        {
+            "$bit": {f"seat_words.{word}": {"and": Int64(SEAT_WORD_MASK ^ mask)} for word, mask in masks.items()},
+            "$inc": {"available_seats": len(seats), "seat_version": 1}
+        },
+        projection=SEAT_MAP_PROJECTION,
+        return_document=ReturnDocument.AFTER
+    )
+    if bus:
+        seats_changed(bus)
+    return bus is not None
+
+async def expire_holds() -> int:
+    now = datetime.now(timezone.utc)
+    expired = 0
+    while True:
+        batch = await db.bookings.find(
+            {"status": "pending", "hold_expires_at": {"$lte": now}},
+            {"_id": 0, "id": 1, "bus_id": 1, "seats": 1, "booking_date": 1}
+        ).limit(HOLD_SWEEP_BATCH).to_list(HOLD_SWEEP_BATCH)
+        
+        # Each booking moves to expired only if still pending (a payment may have just confirmed it).
+        # Seats are released per booking so one inconsistent hold can't keep the rest of the bus locked.
+        released = {}
+        for booking in batch:
+            result = await db.bookings.update_one(
+                {"id": booking['id'], "status": "pending"},
+                {"$set": {"status": "expired"}}
+            )
+            if not result.modified_count:
+                continue
+            expired += 1
+            key = (booking['bus_id'], booking_day(booking))
+            released[key] = released.get(key, 0) + 1
+            if not await release_seats(booking['bus_id'], booking['seats']):
+                logger.error(
+                    f"Expired booking {booking['id']} on bus {booking['bus_id']} did not hold seats {booking['seats']}; "
+                    "seat map needs reconciling"
+                )
+        for (bus_id, day), count in released.items():
+            await record_rollup(bus_id, day, expired=count)
+        
+        if len(batch) < HOLD_SWEEP_BATCH:
+            return expired
+
+async def run_hold_sweeper():
+    while True:
+        try:
+            expired = await expire_holds()
+            if expired:
+                logger.info(f"Released {expired} expired seat holds")
+        except Exception:
+            logger.exception("Seat hold sweep failed")
+        await asyncio.sleep(HOLD_SWEEP_INTERVAL)
+
+# ==================== ANALYTICS ROLLUPS ====================
+
+ROLLUP_FIELDS = ["bookings", "confirmed", "cancelled", "expired", "seats_sold", "revenue"]
+
+def booking_day(booking: dict) -> str:
+    # Every event is credited to the day the booking was made, which is also how rebuild_rollups groups them
+    return booking['booking_date'][:10]
+
+async def record_rollup(bus_id: str, day: str, session=None, **increments):
+    # One document per (day, bus); routes are resolved from the bus at read time
+    await db.booking_rollups.update_one(
+        {"day": day, "bus_id": bus_id},
+        {"$inc": increments},
+        upsert=True,
+        session=session
+    )
+
+def rollup_window(days: int) -> dict:
+    start = (datetime.now(timezone.utc) - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    return {"day": {"$gte": start}}
+
+def rollup_sums() -> dict:
+    return {field: {"$sum": f"${field}"} for field in ROLLUP_FIELDS}
+
+# ==================== JOB QUEUE ====================
+
+class JobQueue:
+    # Post-request work, persisted in db.jobs before it is queued in memory so a restart resumes it.
+    # Jobs are claimed with a conditional update, so several server processes can share the collection.
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.owner = str(uuid.uuid4())  # marks the jobs this process is running
+        self.handlers = {}
+        self.queue = asyncio.Queue()
+        self.tasks = []
+        self.keys = {}  # key -> job ids waiting in order, head first
+        self.running = 0
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+    
+    def handler(self, kind: str):
+        def register(fn):
+            self.handlers[kind] = fn
+            return fn
+        return register
+    
+    async def enqueue(self, *jobs: tuple, key: Optional[str] = None, session=None) -> list:
+        # Jobs sharing a key run one at a time in enqueue order, retries included.
+        # Inside a transaction the caller submits the returned jobs once it has committed.
+        now = datetime.now(timezone.utc)
+        docs = [
+            {"id": str(uuid.uuid4()), "kind": kind, "payload": payload, "key": key, "status": "pending", "attempts": 0, "created_at": now}
+            for kind, payload in jobs
+        ]
+        await db.jobs.insert_many(docs, session=session)
+        if session is None:
+            self.submit(docs)
+        return docs
+    
+    def submit(self, docs: list):
+        for doc in docs:
+            self.schedule(doc['id'], doc['key'])
+    
+    def schedule(self, job_id: str, key: Optional[str]):
+        # Only the head of each key's line is on the shared queue; the rest wait without holding a worker
+        if key is None:
+            self.queue.put_nowait((job_id, None))
+            return
+        waiting = self.keys.setdefault(key, deque())
+        waiting.append(job_id)
+        if len(waiting) == 1:
+            self.queue.put_nowait((job_id, key))
+    
+    def advance(self, key: str):
+        waiting = self.keys[key]
+        waiting.popleft()
+        if waiting:
+            self.queue.put_nowait((waiting[0], key))
+        else:
+            del self.keys[key]
+    
+    async def start(self):
+        # Anything left running by a crashed process is retried once it is clearly abandoned
+        stale = datetime.now(timezone.utc) - timedelta(seconds=JOB_STALE_SECONDS)
+        await db.jobs.update_many({"status": "running", "started_at": {"$lte": stale}}, {"$set": {"status": "pending"}})
+        async for job in db.jobs.find({"status": "pending"}, {"_id": 0, "id": 1, "key": 1}).sort("created_at", ASCENDING):
+            self.schedule(job['id'], job.get('key'))
+        self.tasks = [asyncio.create_task(self.work()) for _ in range(self.workers)]
+    
+    async def stop(self):
+        # Interrupted jobs go straight back to pending so a quick redeploy picks them up
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        await db.jobs.update_many({"status": "running", "owner": self.owner}, {"$set": {"status": "pending"}})
+    
+    async def work(self):
+        while True:
+            job_id, key = await self.queue.get()
+            try:
+                delay = await self.run(job_id)
+            except Exception:
+                # The job is still pending in db.jobs; try again rather than strand it (and its key)
+                logger.exception(f"Job {job_id} could not be run")
+                delay = JOB_RETRY_DELAY
+            finally:
+                self.queue.task_done()
+            
+            if delay is not None:
+                # A keyed job stays at the head of its line while it backs off, so order is kept
+                asyncio.get_running_loop().call_later(delay, self.queue.put_nowait, (job_id, key))
+            elif key is not None:
+                self.advance(key)
+    
+    async def run(self, job_id: str) -> Optional[float]:
+        # Returns the retry delay when the job failed and should run again
+        job = await db.jobs.find_one_and_update(
+            {"id": job_id, "status": "pending"},
+            {"$set": {"status": "running", "owner": self.owner, "started_at": datetime.now(timezone.utc)}, "$inc": {"attempts": 1}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+        if not job:
+            return None  # already claimed by another process
+        
+        self.running += 1
+        try:
+            await self.handlers[job['kind']](**job['payload'])
+        except Exception as e:
+            return await self.retry(job, e)
+        finally:
+            self.running -= 1
+        await db.jobs.delete_one({"id": job_id})
+        self.completed += 1
+        return None
+    
+    async def retry(self, job: dict, error: Exception) -> Optional[float]:
+        if job['attempts'] >= JOB_MAX_ATTEMPTS:
+            logger.error(f"Job {job['id']} ({job['kind']}) failed after {job['attempts']} attempts: {error}")
+            await db.jobs.update_one({"id": job['id']}, {"$set": {"status": "failed", "error": str(error)}})
+            self.failed += 1
+            return None
+        
+        await db.jobs.update_one({"id": job['id']}, {"$set": {"status": "pending", "error": str(error)}})
+        self.retried += 1
+        return JOB_RETRY_DELAY * 2 ** (job['attempts'] - 1)
+    
+    def stats(self) -> dict:
+        return {
+            "queued": self.queue.qsize(),
+            "running": self.running,
+            "ordered_keys": len(self.keys),
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.failed
+        }
+
+job_queue = JobQueue(JOB_WORKERS)
+
+@job_queue.handler("render_ticket")
+async def prerender_ticket(booking_id: str):
+    # Warms ticket_cache so the first download after payment is a cache hit
+    booking = await db.bookings.find_one({"id": booking_id}, {"_id": 0})
+    if not booking or booking['payment_status'] != 'completed':
+        return
+    bus = await db.buses.find_one({"id": booking['bus_id']}, {"_id": 0})
+    if not bus:
+        return
+    await load_ticket(booking, bus)
+
+async def count_confirmation(booking_id: str, bus_id: str, day: str, seats: int, revenue: float, session=None):
+    # Jobs run at least once; the booking's marker flips only on the first run, so a re-run counts nothing
+    marked = await db.bookings.update_one(
+        {"id": booking_id, "rollup_recorded": {"$ne": True}}, {"$set": {"rollup_recorded": True}}, session=session
+    )
+    if marked.modified_count:
+        await record_rollup(bus_id, day, session=session, confirmed=1, seats_sold=seats, revenue=revenue)
+
+@job_queue.handler("record_confirmation")
+async def record_confirmation(bus_id: str, seats: int, revenue: float, day: Optional[str] = None,
+                              booking_id: Optional[str] = None):
+    # Jobs queued before the day and booking were part of the payload fall back to today, unguarded
+    day = day or datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    if booking_id is None:
+        await record_rollup(bus_id, day, confirmed=1, seats_sold=seats, revenue=revenue)
+    elif app.state.supports_transactions:
+        async with await client.start_session() as session:
+            await session.with_transaction(lambda s: count_confirmation(booking_id, bus_id, day, seats, revenue, s))
+    else:
+        # Marker first: a crash in between loses this count (rebuild_rollups restores it) rather than doubling it
+        await count_confirmation(booking_id, bus_id, day, seats, revenue)
+
+def confirmation_jobs(booking: dict) -> list:
+    return [
+        ("record_confirmation", {
+            "bus_id": booking['bus_id'], "seats": len(booking['seats']), "revenue": booking['total_amount'],
+            "day": booking_day(booking), "booking_id": booking['id']
+        }),
+        ("render_ticket", {"booking_id": booking['id']})
+    ]
+
+# ==================== PAYMENT CLIENT ====================
+
+def run_checkout_call(checkout: StripeCheckout, method: str, args: tuple):
+    # StripeCheckout's coroutines make blocking stripe SDK calls, so each one runs on its own loop in a
+    # stripe pool thread, where blocking stalls only that thread and the caller's timeout can still fire
+    return asyncio.run(getattr(checkout, method)(*args))
+
+class PaymentClient:
+    # App-scoped Stripe access: checkouts are reused per webhook URL over one pooled HTTP client,
+    # and upstream calls are capped in number (one pool thread each) and duration
+    def __init__(self, api_key: str, max_concurrency: int, max_pending: int, timeout: float):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.pool = BoundedExecutor(
+            "stripe", lambda: ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="stripe"), max_pending
+        )
+        self.checkouts = LRUCache(maxsize=32)  # webhook URLs come from request host_url
+        self.http_client = None
+        self.timeouts = 0
+    
+    def start(self):
+        # The requests-based client keeps a keep-alive session per stripe pool thread
+        self.http_client = stripe.RequestsClient(timeout=(STRIPE_CONNECT_TIMEOUT, STRIPE_READ_TIMEOUT))
+        stripe.default_http_client = self.http_client
+        stripe.max_network_retries = STRIPE_MAX_RETRIES
+    
+    def close(self):
+        self.checkouts.clear()
+        self.pool.shutdown()
+        if self.http_client:
+            self.http_client.close()
+            self.http_client = None
+    
+    def checkout(self, webhook_url: str = "") -> StripeCheckout:
+        checkout = self.checkouts.get(webhook_url)
+        if checkout is None:
+            checkout = self.checkouts[webhook_url] = StripeCheckout(api_key=self.api_key, webhook_url=webhook_url)
+        return checkout
+    
+    async def call(self, method: str, *args, webhook_url: str = ""):
+        # A timed-out call keeps its thread until STRIPE_READ_TIMEOUT ends the request; only the caller is released
+        checkout = self.checkout(webhook_url)
+        try:
+            return await asyncio.wait_for(self.pool.run(run_checkout_call, checkout, method, args), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise HTTPException(status_code=504, detail="Payment provider timed out")
+    
+    async def create_session(self, request: CheckoutSessionRequest, webhook_url: str) -> CheckoutSessionResponse:
+        return await self.call("create_checkout_session", request, webhook_url=webhook_url)
+    
+    async def get_status(self, session_id: str) -> CheckoutStatusResponse:
+        return await self.call("get_checkout_status", session_id)
+    
+    async def handle_webhook(self, body: bytes, signature: Optional[str]):
+        return await self.call("handle_webhook", body, signature)
+    
+    def stats(self) -> dict:
+        return {
+            **self.pool.stats(),
+            "timeouts": self.timeouts,
+            "checkouts": len(self.checkouts)
+        }
+
+payments = PaymentClient(STRIPE_API_KEY, STRIPE_MAX_CONCURRENCY, STRIPE_MAX_PENDING, STRIPE_CALL_TIMEOUT)
+
+# In-progress upstream status checks by session id, shared by concurrent pollers
+payment_status_flights: Dict[str, asyncio.Future] = {}
+
+def settled_payment_status(transaction: dict) -> Optional[dict]:
+    # Once a session is paid or expired the answer can no longer change, so Stripe is not asked again
+    if transaction.get('checkout'):
+        return transaction['checkout']
+    if transaction['payment_status'] == "completed":
+        return {
+            "status": "complete",
+            "payment_status": "paid",
+            "amount_total": round(transaction['amount'] * 100),
+            "currency": transaction['currency']
+        }
+    return None
+
+async def apply_confirmation(session_id: str, checkout: Optional[dict], session=None) -> tuple:
+    # Returns (booking if this caller completed the payment, bus whose seats were claimed back or None)
+    transaction = await db.payment_transactions.find_one(
+        {"session_id": session_id}, {"_id": 0, "booking_id": 1, "payment_status": 1}, session=session
+    )
+    if not transaction or transaction['payment_status'] == "completed":
+        return None, None
+    
+    # The booking moves first, so a crash before the transaction is marked leaves a state a retry completes
+    confirmed = {"$set": {"payment_status": "completed", "status": "confirmed"}}
+    booking = await db.bookings.find_one_and_update(
+        {"id": transaction['booking_id'], "status": "pending"}, confirmed,
+        projection={"_id": 0}, return_document=ReturnDocument.AFTER, session=session
+    )
+    claimed = None
+    if booking is None:
+        booking = await db.bookings.find_one({"id": transaction['booking_id']}, {"_id": 0}, session=session)
+        if booking and booking['status'] in ("expired", "cancelled"):
+            # Paid after the hold lapsed: confirmed only if the seats can be won back
+            claimed = await claim_seats(booking['bus_id'], booking['seats'], session)
+            if claimed:
+                await db.bookings.update_one({"id": booking['id'], "status": booking['status']}, confirmed, session=session)
+            # Re-read either way: a concurrent confirmer may have won the seats back for this same booking
+            booking = await db.bookings.find_one({"id": booking['id']}, {"_id": 0}, session=session)
+            if booking and booking['status'] != "confirmed":
+                logging.error(f"Booking {booking['id']} was paid after its seats were released and resold; needs a refund")
+    
+    # The single conditional transition that decides which caller completes the payment
+    result = await db.payment_transactions.update_one(
+        {"session_id": session_id, "payment_status": {"$ne": "completed"}},
+        {"$set": {"payment_status": "completed", "status": "completed", **({"checkout": checkout} if checkout else {})}},
+        session=session
+    )
+    if not result.modified_count:
+        return None, claimed
+    return (booking if booking and booking['status'] == "confirmed" else None), claimed
+
+async def confirm_and_enqueue(session_id: str, checkout: Optional[dict], session=None) -> tuple:
+    booking, claimed = await apply_confirmation(session_id, checkout, session)
+    jobs = await job_queue.enqueue(*confirmation_jobs(booking), session=session) if booking else []
+    return booking, claimed, jobs
+
+async def confirm_payment(session_id: str, checkout: Optional[dict] = None) -> bool:
+    # Shared by status polling and webhooks. On a replica set the confirmation and its follow-up jobs
+    # commit together, so a crash can't keep the payment and lose the rollup or the pre-render.
+    if app.state.supports_transactions:
+        async with await client.start_session() as session:
+            booking, claimed, jobs = await session.with_transaction(lambda s: confirm_and_enqueue(session_id, checkout, s))
+        job_queue.submit(jobs)
+    else:
+        booking, claimed, jobs = await confirm_and_enqueue(session_id, checkout)
+    
+    # Seat changes are published only once committed, and once however often the transaction was retried
+    if claimed:
+        seats_changed(claimed)
+    return booking is not None
+
+async def refresh_payment_status(session_id: str) -> dict:
+    started = time.perf_counter()
+    checkout_status = await payments.get_status(session_id)
+    payment_status_cache.record_load(time.perf_counter() - started)
+    status = {
+        "status": checkout_status.status,
+        "payment_status": checkout_status.payment_status,
+        "amount_total": checkout_status.amount_total,
+        "currency": checkout_status.currency
+    }
+    
+    if status['payment_status'] == "paid":
+        await confirm_payment(session_id, status)
+    elif status['status'] == "expired":
+        await db.payment_transactions.update_one(
+            {"session_id": session_id, "payment_status": {"$ne": "completed"}},
+            {"$set": {"payment_status": "expired", "status": "expired", "checkout": status}}
+        )
+    else:
+        payment_status_cache.set(session_id, status)
+    return status
+
+@job_queue.handler("stripe_event")
+async def process_stripe_event(event_id: str, session_id: str, payment_status: str):
+    if payment_status == "paid":
+        await confirm_payment(session_id)
+    await db.stripe_events.update_one({"event_id": event_id}, {"$set": {"processed_at": datetime.now(timezone.utc)}})
+
+async def poll_payment_status(session_id: str) -> dict:
+    flight = payment_status_flights.get(session_id)
+    if flight is None:
+        flight = payment_status_flights[session_id] = asyncio.ensure_future(refresh_payment_status(session_id))
+        flight.add_done_callback(lambda _: payment_status_flights.pop(session_id, None))
+    # Shielded so one poller disconnecting doesn't cancel the check for the others
+    return await asyncio.shield(flight)
+
 # ==================== AUTH HELPERS ====================
 
+# CPU-bound (~250ms at 12 rounds), so handlers run these through auth_pool
+
 def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
 
 def verify_password(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
@@ -154,11 +1692,38 @@ def decode_token(token: str) -> dict:
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+def create_export_token(bus_id: str, user_id: str) -> str:
+    # Short-lived link for one bus's export, so the browser can download it directly instead of buffering
+    # it through fetch. The audience keeps it from being accepted as a login token and vice versa.
+    payload = {
+        'aud': 'bus-export',
+        'bus_id': bus_id,
+        'user_id': user_id,
+        'exp': datetime.now(timezone.utc) + timedelta(seconds=EXPORT_LINK_TTL)
+    }
+    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
+def decode_export_token(token: str, bus_id: str) -> dict:
+    try:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM], audience='bus-export')
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Export link expired")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid export link")
+    if payload.get('bus_id') != bus_id:
+        raise HTTPException(status_code=401, detail="Invalid export link")
+    return payload
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     payload = decode_token(credentials.credentials)
-    user = await db.users.find_one({"id": payload['user_id']}, {"_id": 0})
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
+    user = user_cache.get(payload['user_id'])
+    if user is None:
+        started = time.perf_counter()
+        user = await db.users.find_one({"id": payload['user_id']}, {"_id": 0, "password": 0})
+        user_cache.record_load(time.perf_counter() - started)
+        if not user:
+            raise HTTPException(status_code=401, detail="User not found")
+        cache_user(user)
     return user
 
 async def get_admin_user(current_user: dict = Depends(get_current_user)):
@@ -176,12 +1741,17 @@ async def register(user_data: UserRegister):
     
     user = User(
         email=user_data.email,
-        password=hash_password(user_data.password),
+        password=await auth_pool.run(hash_password, user_data.password),
         name=user_data.name,
         role="user"
     )
     
-    await db.users.insert_one(user.model_dump())
+    try:
+        await db.users.insert_one(user.model_dump())
+    except DuplicateKeyError:
+        # Two registrations for the same email can both pass the lookup above; the unique index decides
+        raise HTTPException(status_code=400, detail="Email already registered")
+    cache_user(user.model_dump())
     token = create_token(user.id, user.email, user.role)
     
     return {
@@ -192,9 +1762,10 @@ async def register(user_data: UserRegister):
 @api_router.post("/auth/login")
 async def login(credentials: UserLogin):
     user = await db.users.find_one({"email": credentials.email}, {"_id": 0})
-    if not user or not verify_password(credentials.password, user['password']):
+    if not user or not await auth_pool.run(verify_password, credentials.password, user['password']):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
+    cache_user(user)
     token = create_token(user['id'], user['email'], user['role'])
     return {
         "token": token,
@@ -208,35 +1779,101 @@ async def get_me(current_user: dict = Depends(get_current_user)):
 # ==================== BUS ROUTES ====================
 
 @api_router.get("/buses/search")
-async def search_buses(route_from: str = None, route_to: str = None, date: str = None):
+async def search_buses(route_from: str = None, route_to: str = None, date: str = None,
+                       days: int = Query(0, ge=0, le=7), cursor: Optional[str] = None,
+                       limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
     query = {}
     if route_from:
-        query["route_from"] = {"$regex": route_from, "$options": "i"}
+        query["route_from_key"] = city_key_filter(route_from)
     if route_to:
-        query["route_to"] = {"$regex": route_to, "$options": "i"}
+        query["route_to_key"] = city_key_filter(route_to)
+    if date:
+        query.update(departure_window_filter(date, days))
+    
+    key = search_cache_key(route_from, route_to, date, days, cursor, limit)
+    page = search_cache.get(key)
+    if page is None:
+        tick = cache_clock.tick
+        started = time.perf_counter()
+        page = await paginate(db.buses, query, BUS_PROJECTION, [("departure_at", ASCENDING), ("id", ASCENDING)], cursor, limit)
+        search_cache.record_load(time.perf_counter() - started)
+        if not cache_clock.changed_since(tick, [item['id'] for item in page['items']], catalogue=True):
+            search_cache.set(key, page)
+    return page
+
+@api_router.get("/buses/{bus_id}/seats")
+async def get_seat_map(bus_id: str, request: Request):
+    snapshot = await load_seat_map(bus_id)
+    headers = {"ETag": snapshot["etag"], "Cache-Control": "no-cache"}
+    if etag_matches(request, snapshot["etag"]):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(snapshot["body"], headers=headers)
+
+@api_router.get("/buses/{bus_id}/seats/stream")
+async def stream_seat_map(bus_id: str):
+    # Subscribe before loading, so a change landing in between is delivered rather than lost
+    subscription = seat_events.subscribe(bus_id)
+    try:
+        snapshot = await load_seat_map(bus_id)
+    except HTTPException:
+        seat_events.unsubscribe(bus_id, subscription)
+        raise
     
-    buses = await db.buses.find(query, {"_id": 0}).to_list(1000)
-    return buses
+    async def events():
+        try:
+            seat_map = snapshot["body"]
+            sent_version = -1
+            while True:
+                if seat_map['version'] > sent_version:
+                    yield f"event: seats\nid: {seat_map['version']}\ndata: {json.dumps(seat_map)}\n\n"
+                    sent_version = seat_map['version']
+                try:
+                    await asyncio.wait_for(subscription.event.wait(), SEAT_STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                subscription.event.clear()
+                seat_map = subscription.latest
+        finally:
+            seat_events.unsubscribe(bus_id, subscription)
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
 
 @api_router.get("/buses/{bus_id}")
 async def get_bus(bus_id: str):
-    bus = await db.buses.find_one({"id": bus_id}, {"_id": 0})
-    if not bus:
-        raise HTTPException(status_code=404, detail="Bus not found")
+    bus = bus_cache.get(bus_id)
+    if bus is None:
+        tick = cache_clock.tick
+        started = time.perf_counter()
+        bus = await db.buses.find_one({"id": bus_id}, BUS_PROJECTION)
+        bus_cache.record_load(time.perf_counter() - started)
+        if not bus:
+            raise HTTPException(status_code=404, detail="Bus not found")
+        if not cache_clock.changed_since(tick, [bus_id]):
+            bus_cache.set(bus_id, bus)
     return bus
 
 # ==================== BOOKING ROUTES ====================
 
 @api_router.post("/bookings")
 async def create_booking(booking_data: BookingCreate, current_user: dict = Depends(get_current_user)):
-    bus = await db.buses.find_one({"id": booking_data.bus_id}, {"_id": 0})
-    if not bus:
-        raise HTTPException(status_code=404, detail="Bus not found")
+    seats = booking_data.seats
+    if not seats or len(set(seats)) != len(seats) or min(seats) < 1:
+        raise HTTPException(status_code=400, detail="Invalid seat selection")
     
-    if bus['available_seats'] < len(booking_data.seats):
-        raise HTTPException(status_code=400, detail="Not enough seats available")
+    bus = await claim_seats(booking_data.bus_id, seats)
+    if not bus:
+        existing = await db.buses.find_one({"id": booking_data.bus_id}, {"_id": 0, "total_seats": 1})
+        if not existing:
+            raise HTTPException(status_code=404, detail="Bus not found")
+        if max(seats) > existing['total_seats']:
+            raise HTTPException(status_code=400, detail="Invalid seat selection")
+        raise HTTPException(status_code=400, detail="Selected seats are no longer available")
     
-    total_amount = bus['price'] * len(booking_data.seats)
+    total_amount = bus['price'] * len(seats)
     
     booking = Booking(
         user_id=current_user['id'],
@@ -245,22 +1882,28 @@ async def create_booking(booking_data: BookingCreate, current_user: dict = Depen
         total_amount=total_amount,
         passenger_name=booking_data.passenger_name,
         passenger_email=booking_data.passenger_email,
-        passenger_phone=booking_data.passenger_phone
+        passenger_phone=booking_data.passenger_phone,
+        hold_expires_at=datetime.now(timezone.utc) + timedelta(minutes=SEAT_HOLD_MINUTES)
     )
     
-    await db.bookings.insert_one(booking.model_dump())
-    return booking.model_dump()
+    doc = booking.model_dump()
+    try:
+        await db.bookings.insert_one(doc.copy())
+    except Exception:
+        await release_seats(booking.bus_id, seats)
+        raise
+    await record_rollup(booking.bus_id, booking_day(doc), bookings=1)
+    return doc
 
 @api_router.get("/bookings")
-async def get_user_bookings(current_user: dict = Depends(get_current_user)):
-    bookings = await db.bookings.find({"user_id": current_user['id']}, {"_id": 0}).to_list(1000)
-    
-    # Enrich with bus details
-    for booking in bookings:
-        bus = await db.buses.find_one({"id": booking['bus_id']}, {"_id": 0})
-        booking['bus_details'] = bus
-    
-    return bookings
+async def get_user_bookings(cursor: Optional[str] = None, limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                            current_user: dict = Depends(get_current_user)):
+    page = await paginate(
+        db.bookings, {"user_id": current_user['id']}, {"_id": 0},
+        [("booking_date", DESCENDING), ("id", DESCENDING)], cursor, limit
+    )
+    await attach_details(page["items"])
+    return page
 
 @api_router.get("/bookings/{booking_id}")
 async def get_booking(booking_id: str, current_user: dict = Depends(get_current_user)):
@@ -268,7 +1911,7 @@ async def get_booking(booking_id: str, current_user: dict = Depends(get_current_
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
     
-    bus = await db.buses.find_one({"id": booking['bus_id']}, {"_id": 0})
+    bus = await db.buses.find_one({"id": booking['bus_id']}, BUS_PROJECTION)
     booking['bus_details'] = bus
     return booking
 
@@ -281,16 +1924,23 @@ async def cancel_booking(booking_id: str, current_user: dict = Depends(get_curre
     if booking['status'] == 'confirmed':
         raise HTTPException(status_code=400, detail="Cannot cancel confirmed booking")
     
-    # Update booking status
-    await db.bookings.update_one(
-        {"id": booking_id},
+    # Only the request that actually moves the booking to cancelled gives its seats back
+    result = await db.bookings.update_one(
+        {"id": booking_id, "status": "pending"},
         {"$set": {"status": "cancelled"}}
     )
+    if not result.modified_count:
+        # Already cancelled, or confirmed/expired since it was read
+        current = await db.bookings.find_one({"id": booking_id}, {"_id": 0, "status": 1})
+        raise HTTPException(status_code=400, detail=f"Cannot cancel {current['status'] if current else 'missing'} booking")
+    
+    await release_seats(booking['bus_id'], booking['seats'])
+    await record_rollup(booking['bus_id'], booking_day(booking), cancelled=1)
     
     return {"message": "Booking cancelled successfully"}
 
 @api_router.get("/bookings/{booking_id}/download")
-async def download_ticket(booking_id: str, current_user: dict = Depends(get_current_user)):
+async def download_ticket(booking_id: str, request: Request, current_user: dict = Depends(get_current_user)):
     booking = await db.bookings.find_one({"id": booking_id, "user_id": current_user['id']}, {"_id": 0})
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
@@ -300,59 +1950,17 @@ async def download_ticket(booking_id: str, current_user: dict = Depends(get_curr
     
     bus = await db.buses.find_one({"id": booking['bus_id']}, {"_id": 0})
     
-    # Generate PDF with QR code
-    buffer = io.BytesIO()
-    p = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-    
-    # QR Code
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(f"BOOKING:{booking_id}")
-    qr.make(fit=True)
-    qr_img = qr.make_image(fill_color="black", back_color="white")
-    qr_buffer = io.BytesIO()
-    qr_img.save(qr_buffer, format='PNG')
-    qr_buffer.seek(0)
-    
-    # Draw ticket
-    p.setFont("Helvetica-Bold", 24)
-    p.drawString(200, height - 100, "Bus Ticket")
-    
-    p.setFont("Helvetica", 12)
-    y_position = height - 150
-    
-    details = [
-        f"Booking ID: {booking_id}",
-        f"Passenger: {booking['passenger_name']}",
-        f"Email: {booking['passenger_email']}",
-        f"Phone: {booking['passenger_phone']}",
-        "",
-        f"Bus Number: {bus['bus_number']}",
-        f"Route: {bus['route_from']} to {bus['route_to']}",
-        f"Departure: {bus['departure_time']}",
-        f"Arrival: {bus['arrival_time']}",
-        f"Seats: {', '.join(map(str, booking['seats']))}",
-        f"Total Amount: ${booking['total_amount']:.2f}",
-        "",
-        f"Booking Date: {booking['booking_date'][:10]}",
-        f"Status: {booking['status'].upper()}"
-    ]
-    
-    for detail in details:
-        p.drawString(100, y_position, detail)
-        y_position -= 25
-    
-    # Add QR code
-    qr_image = ImageReader(qr_buffer)
-    p.drawImage(qr_image, width - 200, height - 300, width=150, height=150)
-    
-    p.showPage()
-    p.save()
+    fingerprint = ticket_fingerprint(booking, bus)
+    headers = {
+        "Content-Disposition": f"attachment; filename=ticket_{booking_id}.pdf",
+        "ETag": f'"{fingerprint}"',
+        "Cache-Control": "private, no-cache"
+    }
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
     
-    buffer.seek(0)
-    return StreamingResponse(buffer, media_type="application/pdf", headers={
-        "Content-Disposition": f"attachment; filename=ticket_{booking_id}.pdf"
-    })
+    pdf = await load_ticket(booking, bus, fingerprint)
+    return Response(content=pdf, media_type="application/pdf", headers=headers)
 
 # ==================== PAYMENT ROUTES ====================
 
@@ -368,9 +1976,10 @@ async def create_payment_session(data: dict, current_user: dict = Depends(get_cu
     if booking['payment_status'] == 'completed':
         raise HTTPException(status_code=400, detail="Booking already paid")
     
-    # Initialize Stripe
+    if booking['status'] != 'pending':
+        raise HTTPException(status_code=400, detail=f"Booking is {booking['status']}")
+    
     webhook_url = f"{host_url}/api/webhook/stripe"
-    stripe_checkout = StripeCheckout(api_key=STRIPE_API_KEY, webhook_url=webhook_url)
     
     # Create checkout session
     success_url = f"{host_url}/payment-success?session_id={{CHECKOUT_SESSION_ID}}"
@@ -387,7 +1996,7 @@ async def create_payment_session(data: dict, current_user: dict = Depends(get_cu
         }
     )
     
-    session = await stripe_checkout.create_checkout_session(checkout_request)
+    session = await payments.create_session(checkout_request, webhook_url)
     
     # Create payment transaction
     transaction = PaymentTransaction(
@@ -412,84 +2021,75 @@ async def get_payment_status(session_id: str, current_user: dict = Depends(get_c
     if not transaction:
         raise HTTPException(status_code=404, detail="Transaction not found")
     
-    # Check with Stripe
-    stripe_checkout = StripeCheckout(api_key=STRIPE_API_KEY, webhook_url="")
-    checkout_status = await stripe_checkout.get_checkout_status(session_id)
-    
-    # Update if payment completed and not already processed
-    if checkout_status.payment_status == "paid" and transaction['payment_status'] != "completed":
-        await db.payment_transactions.update_one(
-            {"session_id": session_id},
-            {"$set": {"payment_status": "completed", "status": "completed"}}
-        )
-        
-        booking = await db.bookings.find_one({"id": transaction['booking_id']}, {"_id": 0})
-        if booking:
-            # Update booking
-            await db.bookings.update_one(
-                {"id": transaction['booking_id']},
-                {"$set": {"payment_status": "completed", "status": "confirmed"}}
-            )
-            
-            # Update bus available seats
-            await db.buses.update_one(
-                {"id": booking['bus_id']},
-                {"$inc": {"available_seats": -len(booking['seats'])}}
-            )
+    settled = settled_payment_status(transaction)
+    if settled:
+        return settled
     
-    return {
-        "status": checkout_status.status,
-        "payment_status": checkout_status.payment_status,
-        "amount_total": checkout_status.amount_total,
-        "currency": checkout_status.currency
-    }
+    status = payment_status_cache.get(session_id)
+    if status is None:
+        status = await poll_payment_status(session_id)
+    return status
 
 @api_router.post("/webhook/stripe")
 async def stripe_webhook(request: Request):
     body = await request.body()
     signature = request.headers.get("Stripe-Signature")
     
-    stripe_checkout = StripeCheckout(api_key=STRIPE_API_KEY, webhook_url="")
-    
     try:
-        webhook_response = await stripe_checkout.handle_webhook(body, signature)
-        
-        if webhook_response.payment_status == "paid":
-            transaction = await db.payment_transactions.find_one(
-                {"session_id": webhook_response.session_id, "payment_status": {"$ne": "completed"}},
-                {"_id": 0}
-            )
-            
-            if transaction:
-                await db.payment_transactions.update_one(
-                    {"session_id": webhook_response.session_id},
-                    {"$set": {"payment_status": "completed", "status": "completed"}}
-                )
-                
-                booking = await db.bookings.find_one({"id": transaction['booking_id']}, {"_id": 0})
-                if booking:
-                    await db.bookings.update_one(
-                        {"id": transaction['booking_id']},
-                        {"$set": {"payment_status": "completed", "status": "confirmed"}}
-                    )
-                    
-                    await db.buses.update_one(
-                        {"id": booking['bus_id']},
-                        {"$inc": {"available_seats": -len(booking['seats'])}}
-                    )
-        
-        return {"status": "success"}
+        webhook_response = await payments.handle_webhook(body, signature)
     except Exception as e:
         logging.error(f"Webhook error: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
+    
+    # Stripe redelivers until acknowledged; the unique event_id makes every repeat a single failed insert
+    event_id = getattr(webhook_response, 'event_id', None) or hashlib.sha256(body).hexdigest()
+    try:
+        await db.stripe_events.insert_one({
+            "event_id": event_id,
+            "event_type": getattr(webhook_response, 'event_type', None),
+            "session_id": webhook_response.session_id,
+            "payment_status": webhook_response.payment_status,
+            "received_at": datetime.now(timezone.utc)
+        })
+    except DuplicateKeyError:
+        return {"status": "duplicate"}
+    
+    if webhook_response.payment_status != "paid":
+        return {"status": "success"}
+    
+    # Events for one booking are processed in the order they arrived
+    metadata = getattr(webhook_response, 'metadata', None) or {}
+    try:
+        await job_queue.enqueue(
+            ("stripe_event", {
+                "event_id": event_id,
+                "session_id": webhook_response.session_id,
+                "payment_status": webhook_response.payment_status
+            }),
+            key=metadata.get('booking_id') or webhook_response.session_id
+        )
+    except Exception:
+        # Forget the event so Stripe's retry is not mistaken for a duplicate
+        await db.stripe_events.delete_one({"event_id": event_id})
+        raise
+    
+    return {"status": "success"}
 
 # ==================== ADMIN ROUTES ====================
 
 @api_router.post("/admin/buses")
 async def create_bus(bus_data: BusCreate, admin: dict = Depends(get_admin_user)):
-    bus = Bus(**bus_data.model_dump(), available_seats=bus_data.total_seats)
-    await db.buses.insert_one(bus.model_dump())
-    return bus.model_dump()
+    bus = Bus(
+        **bus_data.model_dump(),
+        **route_keys(bus_data.route_from, bus_data.route_to),
+        departure_at=parse_departure(bus_data.departure_date, bus_data.departure_time),
+        available_seats=bus_data.total_seats
+    )
+    document = bus.model_dump()
+    document['seat_words'] = empty_seat_words(bus.total_seats)
+    await db.buses.insert_one(document)
+    invalidate_bus(document)
+    return bus.model_dump(exclude=BUS_INTERNAL_FIELDS)
 
 @api_router.put("/admin/buses/{bus_id}")
 async def update_bus(bus_id: str, bus_data: BusCreate, admin: dict = Depends(get_admin_user)):
@@ -497,70 +2097,244 @@ async def update_bus(bus_id: str, bus_data: BusCreate, admin: dict = Depends(get
     if not existing:
         raise HTTPException(status_code=404, detail="Bus not found")
     
-    await db.buses.update_one(
-        {"id": bus_id},
-        {"$set": bus_data.model_dump()}
+    changes = {
+        **bus_data.model_dump(),
+        **route_keys(bus_data.route_from, bus_data.route_to),
+        "departure_at": parse_departure(bus_data.departure_date, bus_data.departure_time)
+    }
+    query = {"id": bus_id}
+    if bus_data.total_seats != existing['total_seats']:
+        # Resize the seat map; guarded on the old map so a concurrent booking can't be lost
+        seat_words = existing.get('seat_words', [])
+        taken = occupied_seats(seat_words)
+        if taken and max(taken) > bus_data.total_seats:
+            raise HTTPException(status_code=400, detail="Cannot remove seats that are already booked")
+        resized = empty_seat_words(bus_data.total_seats)
+        resized[:len(seat_words)] = [Int64(word) for word in seat_words[:len(resized)]]
+        changes["seat_words"] = resized
+        changes["available_seats"] = bus_data.total_seats - len(taken)
+        query["seat_words"] = seat_words
+    
+    update = {"$set": changes}
+    if "seat_words" in changes:
+        update["$inc"] = {"seat_version": 1}
+    bus = await db.buses.find_one_and_update(
+        query, update, projection=SEAT_MAP_PROJECTION, return_document=ReturnDocument.AFTER
     )
+    if bus is None:
+        raise HTTPException(status_code=409, detail="Seats changed while updating, please retry")
+    invalidate_bus(existing, {**existing, **changes})
+    if "seat_words" in changes:
+        seats_changed(bus)
+    ticket_cache.invalidate(bus_id)
     return {"message": "Bus updated successfully"}
 
 @api_router.delete("/admin/buses/{bus_id}")
 async def delete_bus(bus_id: str, admin: dict = Depends(get_admin_user)):
-    result = await db.buses.delete_one({"id": bus_id})
-    if result.deleted_count == 0:
+    deleted = await db.buses.find_one_and_delete({"id": bus_id})
+    if not deleted:
         raise HTTPException(status_code=404, detail="Bus not found")
+    invalidate_bus(deleted)
+    ticket_cache.invalidate(bus_id)
     return {"message": "Bus deleted successfully"}
 
 @api_router.get("/admin/buses")
-async def get_all_buses(admin: dict = Depends(get_admin_user)):
-    buses = await db.buses.find({}, {"_id": 0}).to_list(1000)
-    return buses
+async def get_all_buses(cursor: Optional[str] = None, limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                        admin: dict = Depends(get_admin_user)):
+    return await paginate(db.buses, {}, BUS_PROJECTION, [("created_at", DESCENDING), ("id", DESCENDING)], cursor, limit)
 
-@api_router.get("/admin/bookings")
-async def get_all_bookings(admin: dict = Depends(get_admin_user)):
-    bookings = await db.bookings.find({}, {"_id": 0}).to_list(1000)
+@api_router.post("/admin/buses/{bus_id}/export")
+async def create_bus_export_link(bus_id: str, admin: dict = Depends(get_admin_user)):
+    if not await db.buses.find_one({"id": bus_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Bus not found")
     
-    for booking in bookings:
-        bus = await db.buses.find_one({"id": booking['bus_id']}, {"_id": 0})
-        user = await db.users.find_one({"id": booking['user_id']}, {"_id": 0, "password": 0})
-        booking['bus_details'] = bus
-        booking['user_details'] = user
+    token = create_export_token(bus_id, admin['id'])
+    return {"url": f"/api/admin/buses/{bus_id}/export?token={token}", "expires_in": EXPORT_LINK_TTL}
+
+@api_router.get("/admin/buses/{bus_id}/export")
+async def export_bus_tickets(bus_id: str, token: str):
+    decode_export_token(token, bus_id)
+    bus = await db.buses.find_one({"id": bus_id}, {"_id": 0})
+    if not bus:
+        raise HTTPException(status_code=404, detail="Bus not found")
     
-    return bookings
+    return StreamingResponse(stream_bus_export(bus), media_type="application/zip", headers={
+        "Content-Disposition": f"attachment; filename=bus_{re.sub(r'[^A-Za-z0-9_-]', '_', bus['bus_number'])}.zip",
+        "Cache-Control": "no-store"
+    })
+
+@api_router.get("/admin/bookings")
+async def get_all_bookings(cursor: Optional[str] = None, limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                           admin: dict = Depends(get_admin_user)):
+    page = await paginate(db.bookings, {}, {"_id": 0}, [("booking_date", DESCENDING), ("id", DESCENDING)], cursor, limit)
+    await attach_details(page["items"], include_users=True)
+    return page
 
 @api_router.get("/admin/users")
-async def get_all_users(admin: dict = Depends(get_admin_user)):
-    users = await db.users.find({}, {"_id": 0, "password": 0}).to_list(1000)
-    return users
+async def get_all_users(cursor: Optional[str] = None, limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                        admin: dict = Depends(get_admin_user)):
+    return await paginate(
+        db.users, {}, {"_id": 0, "password": 0},
+        [("created_at", DESCENDING), ("id", DESCENDING)], cursor, limit
+    )
 
 @api_router.get("/admin/analytics")
 async def get_analytics(admin: dict = Depends(get_admin_user)):
-    total_buses = await db.buses.count_documents({})
-    total_bookings = await db.bookings.count_documents({})
-    total_users = await db.users.count_documents({"role": "user"})
-    
-    confirmed_bookings = await db.bookings.count_documents({"status": "confirmed"})
-    pending_bookings = await db.bookings.count_documents({"status": "pending"})
-    
-    # Revenue calculation
-    all_bookings = await db.bookings.find({"payment_status": "completed"}, {"_id": 0}).to_list(1000)
-    total_revenue = sum([b.get('total_amount', 0) for b in all_bookings])
+    # Counts, revenue and recent bookings in one pass over bookings; the two other counts run alongside it
+    pipeline = [
+        {"$facet": {
+            "totals": [
+                {"$group": {
+                    "_id": None,
+                    "total_bookings": {"$sum": 1},
+                    "confirmed_bookings": {"$sum": {"$cond": [{"$eq": ["$status", "confirmed"]}, 1, 0]}},
+                    "pending_bookings": {"$sum": {"$cond": [{"$eq": ["$status", "pending"]}, 1, 0]}},
+                    "total_revenue": {"$sum": {"$cond": [{"$eq": ["$payment_status", "completed"]}, "$total_amount", 0]}}
+                }}
+            ],
+            "recent_bookings": [
+                {"$sort": {"booking_date": -1}},
+                {"$limit": 10},
+                {"$lookup": {"from": "buses", "localField": "bus_id", "foreignField": "id", "as": "bus_details"}},
+                {"$set": {"bus_details": {"$arrayElemAt": ["$bus_details", 0]}}},
+                {"$project": {"_id": 0, **{f"bus_details.{field}": 0 for field in BUS_PROJECTION}}}
+            ]
+        }}
+    ]
     
-    # Recent bookings
-    recent_bookings = await db.bookings.find({}, {"_id": 0}).sort("booking_date", -1).limit(10).to_list(10)
-    for booking in recent_bookings:
-        bus = await db.buses.find_one({"id": booking['bus_id']}, {"_id": 0})
-        booking['bus_details'] = bus
+    total_buses, total_users, facets = await asyncio.gather(
+        db.buses.estimated_document_count(),
+        db.users.count_documents({"role": "user"}),
+        db.bookings.aggregate(pipeline).to_list(1)
+    )
+    totals = facets[0]["totals"][0] if facets[0]["totals"] else {}
     
     return {
         "total_buses": total_buses,
-        "total_bookings": total_bookings,
+        "total_bookings": totals.get("total_bookings", 0),
         "total_users": total_users,
-        "confirmed_bookings": confirmed_bookings,
-        "pending_bookings": pending_bookings,
-        "total_revenue": total_revenue,
-        "recent_bookings": recent_bookings
+        "confirmed_bookings": totals.get("confirmed_bookings", 0),
+        "pending_bookings": totals.get("pending_bookings", 0),
+        "total_revenue": totals.get("total_revenue", 0),
+        "recent_bookings": facets[0]["recent_bookings"]
     }
 
+@api_router.get("/admin/analytics/daily")
+async def get_daily_analytics(days: int = Query(30, ge=1, le=366), bus_id: Optional[str] = None,
+                              admin: dict = Depends(get_admin_user)):
+    match = rollup_window(days)
+    if bus_id:
+        match["bus_id"] = bus_id
+    
+    pipeline = [
+        {"$match": match},
+        {"$group": {"_id": "$day", **rollup_sums()}},
+        {"$sort": {"_id": 1}},
+        {"$project": {"_id": 0, "day": "$_id", **{field: 1 for field in ROLLUP_FIELDS}}}
+    ]
+    return await db.booking_rollups.aggregate(pipeline).to_list(days)
+
+@api_router.get("/admin/analytics/buses")
+async def get_bus_analytics(days: int = Query(30, ge=1, le=366), admin: dict = Depends(get_admin_user)):
+    pipeline = [
+        {"$match": rollup_window(days)},
+        {"$group": {"_id": "$bus_id", **rollup_sums()}},
+        {"$lookup": {"from": "buses", "localField": "_id", "foreignField": "id", "as": "bus"}},
+        {"$set": {"bus": {"$arrayElemAt": ["$bus", 0]}}},
+        {"$project": {
+            "_id": 0, "bus_id": "$_id", "bus_number": "$bus.bus_number",
+            "route_from": "$bus.route_from", "route_to": "$bus.route_to",
+            **{field: 1 for field in ROLLUP_FIELDS}
+        }},
+        {"$sort": {"revenue": -1}}
+    ]
+    return await db.booking_rollups.aggregate(pipeline).to_list(None)
+
+@api_router.get("/admin/analytics/routes")
+async def get_route_analytics(days: int = Query(30, ge=1, le=366), admin: dict = Depends(get_admin_user)):
+    pipeline = [
+        {"$match": rollup_window(days)},
+        {"$group": {"_id": "$bus_id", **rollup_sums()}},
+        {"$lookup": {"from": "buses", "localField": "_id", "foreignField": "id", "as": "bus"}},
+        {"$set": {"bus": {"$arrayElemAt": ["$bus", 0]}}},
+        {"$group": {
+            "_id": {"route_from": "$bus.route_from", "route_to": "$bus.route_to"},
+            **{field: {"$sum": f"${field}"} for field in ROLLUP_FIELDS}
+        }},
+        {"$project": {"_id": 0, "route_from": "$_id.route_from", "route_to": "$_id.route_to", **{field: 1 for field in ROLLUP_FIELDS}}},
+        {"$sort": {"revenue": -1}}
+    ]
+    return await db.booking_rollups.aggregate(pipeline).to_list(None)
+
+@api_router.post("/admin/analytics/rebuild")
+async def rebuild_rollups(admin: dict = Depends(get_admin_user)):
+    # Recompute rollups from raw bookings into a scratch collection, then swap it in with one rename
+    # so readers never see an empty or half-built table
+    scratch = f"booking_rollups_rebuild_{uuid.uuid4().hex}"
+    completed = {"$eq": ["$payment_status", "completed"]}
+    pipeline = [
+        {"$group": {
+            "_id": {"day": {"$substrCP": ["$booking_date", 0, 10]}, "bus_id": "$bus_id"},
+            "bookings": {"$sum": 1},
+            "confirmed": {"$sum": {"$cond": [completed, 1, 0]}},
+            "cancelled": {"$sum": {"$cond": [{"$eq": ["$status", "cancelled"]}, 1, 0]}},
+            "expired": {"$sum": {"$cond": [{"$eq": ["$status", "expired"]}, 1, 0]}},
+            "seats_sold": {"$sum": {"$cond": [completed, {"$size": "$seats"}, 0]}},
+            "revenue": {"$sum": {"$cond": [completed, "$total_amount", 0]}}
+        }},
+        {"$project": {"_id": 0, "day": "$_id.day", "bus_id": "$_id.bus_id", **{field: 1 for field in ROLLUP_FIELDS}}},
+        {"$out": scratch}
+    ]
+    # $out keeps the indexes of an existing target, so the swapped-in collection stays upsert-safe
+    await db[scratch].create_indexes(REQUIRED_INDEXES["booking_rollups"])
+    try:
+        await db.bookings.aggregate(pipeline).to_list(None)
+        await db[scratch].rename("booking_rollups", dropTarget=True)
+    except Exception:
+        await db[scratch].drop()
+        raise
+    return {"message": "Rollups rebuilt successfully"}
+
+@api_router.get("/admin/cache/stats")
+async def get_cache_stats(admin: dict = Depends(get_admin_user)):
+    return {
+        "search": search_cache.stats(),
+        "bus": bus_cache.stats(),
+        "seat_map": seat_map_cache.stats(),
+        "user": user_cache.stats(),
+        "payment_status": payment_status_cache.stats(),
+        "tickets": ticket_cache.stats()
+    }
+
+@api_router.get("/admin/pools/stats")
+async def get_pool_stats(admin: dict = Depends(get_admin_user)):
+    return {
+        "auth": auth_pool.stats(),
+        "tickets": ticket_pool.stats(),
+        "jobs": job_queue.stats(),
+        "stripe": payments.stats()
+    }
+
+@api_router.get("/admin/streams/stats")
+async def get_stream_stats(admin: dict = Depends(get_admin_user)):
+    return {
+        "seats": seat_events.stats()
+    }
+
+@api_router.get("/metrics")
+async def get_metrics(request: Request):
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+@api_router.get("/admin/slow-queries/stats")
+async def get_slow_query_stats(admin: dict = Depends(get_admin_user)):
+    return slow_query_log.stats()
+
+@api_router.get("/admin/indexes")
+async def get_index_report(admin: dict = Depends(get_admin_user)):
+    return app.state.index_report
+
 app.include_router(api_router)
 
 app.add_middleware(
@@ -577,6 +2351,82 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def bootstrap_indexes():
+    app.state.index_report = await ensure_indexes()
+
+@app.on_event("startup")
+async def start_slow_query_log():
+    slow_query_log.start(asyncio.get_running_loop())
+
+@app.on_event("startup")
+async def detect_transactions():
+    # Multi-document transactions need a replica set or sharded cluster
+    hello = await client.admin.command("hello")
+    app.state.supports_transactions = "setName" in hello or hello.get("msg") == "isdbgrid"
+
+@app.on_event("startup")
+async def backfill_bus_fields():
+    # Backfill normalized keys and parsed departures for buses created before they existed
+    updates = []
+    legacy = {"$or": [{"route_from_key": {"$exists": False}}, {"departure_at": {"$exists": False}}]}
+    async for bus in db.buses.find(legacy, {"route_from": 1, "route_to": 1, "departure_time": 1}):
+        updates.append(UpdateOne({"_id": bus["_id"]}, {"$set": {
+            **route_keys(bus["route_from"], bus["route_to"]),
+            "departure_at": parse_departure(None, bus["departure_time"])
+        }}))
+        if len(updates) >= 500:
+            await db.buses.bulk_write(updates, ordered=False)
+            updates = []
+    if updates:
+        await db.buses.bulk_write(updates, ordered=False)
+
+@app.on_event("startup")
+async def backfill_seat_maps():
+    # Build seat maps for buses created before seat-level inventory, from their live bookings
+    async for bus in db.buses.find({"seat_words": {"$exists": False}}, {"id": 1, "total_seats": 1}):
+        seat_words = empty_seat_words(bus["total_seats"])
+        taken = set()
+        async for booking in db.bookings.find({"bus_id": bus["id"], "status": {"$ne": "cancelled"}}, {"seats": 1}):
+            taken.update(seat for seat in booking["seats"] if 1 <= seat <= bus["total_seats"])
+        for word, mask in seat_masks(sorted(taken)).items():
+            seat_words[word] = Int64(mask)
+        await db.buses.update_one(
+            {"_id": bus["_id"], "seat_words": {"$exists": False}},
+            {"$set": {"seat_words": seat_words, "available_seats": bus["total_seats"] - len(taken)}}
+        )
+
+@app.on_event("startup")
+async def backfill_hold_expiry():
+    # Pending bookings from before seat holds existed get a fresh hold window instead of keeping their seats forever
+    await db.bookings.update_many(
+        {"status": "pending", "hold_expires_at": None},
+        {"$set": {"hold_expires_at": datetime.now(timezone.utc) + timedelta(minutes=SEAT_HOLD_MINUTES)}}
+    )
+
+@app.on_event("startup")
+async def start_hold_sweeper():
+    app.state.hold_sweeper = asyncio.create_task(run_hold_sweeper())
+
+@app.on_event("startup")
+async def start_payment_client():
+    payments.start()
+
+@app.on_event("startup")
+async def start_job_queue():
+    await job_queue.start()
+
+@app.on_event("startup")
+async def start_seat_change_stream():
+    app.state.seat_change_stream = asyncio.create_task(watch_seat_changes()) if SEAT_CHANGE_STREAM else None
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    app.state.hold_sweeper.cancel()
+    if app.state.seat_change_stream:
+        app.state.seat_change_stream.cancel()
+    await job_queue.stop()
+    client.close()
+    payments.close()
+    auth_pool.shutdown()
+    ticket_pool.shutdown()
\ No newline at end of file
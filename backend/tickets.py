@@ -0,0 +1,60 @@
+# Ticket rendering for server.ticket_pool's worker processes. Workers import only this module,
+# so it must stay free of side effects: no config, database clients or caches.
+import io
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+from reportlab.lib.utils import ImageReader
+import qrcode
+
+
+def render_ticket_pdf(booking: dict, bus: dict) -> bytes:
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer, pagesize=letter)
+    width, height = letter
+    
+    # QR Code
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(f"BOOKING:{booking['id']}")
+    qr.make(fit=True)
+    qr_img = qr.make_image(fill_color="black", back_color="white")
+    qr_buffer = io.BytesIO()
+    qr_img.save(qr_buffer, format='PNG')
+    qr_buffer.seek(0)
+    
+    # Draw ticket
+    p.setFont("Helvetica-Bold", 24)
+    p.drawString(200, height - 100, "Bus Ticket")
+    
+    p.setFont("Helvetica", 12)
+    y_position = height - 150
+    
+    details = [
+        f"Booking ID: {booking['id']}",
+        f"Passenger: {booking['passenger_name']}",
+        f"Email: {booking['passenger_email']}",
+        f"Phone: {booking['passenger_phone']}",
+        "",
+        f"Bus Number: {bus['bus_number']}",
+        f"Route: {bus['route_from']} to {bus['route_to']}",
+        f"Departure: {bus['departure_time']}",
+        f"Arrival: {bus['arrival_time']}",
+        f"Seats: {', '.join(map(str, booking['seats']))}",
+        f"Total Amount: ${booking['total_amount']:.2f}",
+        "",
+        f"Booking Date: {booking['booking_date'][:10]}",
+        f"Status: {booking['status'].upper()}"
+    ]
+    
+    for detail in details:
+        p.drawString(100, y_position, detail)
+        y_position -= 25
+    
+    # Add QR code
+    qr_image = ImageReader(qr_buffer)
+    p.drawImage(qr_image, width - 200, height - 300, width=150, height=150)
+    
+    p.showPage()
+    p.save()
+    
+    return buffer.getvalue()
@@ -0,0 +1,352 @@
+"""Load-test benchmark for the bus booking API.
+
+Boots backend/server.py in-process (httpx ASGITransport, with startup/shutdown hooks) against a local
+mongod and a fake StripeCheckout, seeds a throwaway database, drives concurrent
+search -> book -> pay -> download flows and reports throughput and latency percentiles per endpoint.
+
+    python backend_benchmark.py --buses 200 --users 500 --bookings 3000 --flows 2000 --concurrency 64
+
+Client and server share one event loop, so absolute numbers include client overhead; compare runs
+made with the same options on the same machine.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import sys
+import time
+import types
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent
+
+CITIES = ["New York", "Boston", "Philadelphia", "Washington", "Baltimore", "Pittsburgh", "Chicago", "Detroit"]
+BENCH_PASSWORD = "bench-password"
+
+
+class FakeStripeCheckout:
+    """Stand-in for emergentintegrations' StripeCheckout; every session is paid once created"""
+    latency = 0.0
+
+    def __init__(self, api_key, webhook_url=""):
+        self.webhook_url = webhook_url
+
+    async def create_checkout_session(self, request):
+        await asyncio.sleep(self.latency)
+        session_id = f"cs_bench_{uuid.uuid4().hex}"
+        return types.SimpleNamespace(session_id=session_id, url=f"https://checkout.invalid/{session_id}")
+
+    async def get_checkout_status(self, session_id):
+        await asyncio.sleep(self.latency)
+        return types.SimpleNamespace(status="complete", payment_status="paid", amount_total=0, currency="usd")
+
+    async def handle_webhook(self, body, signature):
+        event = json.loads(body)
+        return types.SimpleNamespace(
+            event_id=event.get("id"), event_type=event.get("type"), session_id=event.get("session_id"),
+            payment_status=event.get("payment_status"), metadata=event.get("metadata", {})
+        )
+
+
+def install_fake_stripe(latency_ms):
+    """Register the fake under the module path server.py imports from"""
+    FakeStripeCheckout.latency = latency_ms / 1000
+    checkout = types.ModuleType("emergentintegrations.payments.stripe.checkout")
+    checkout.StripeCheckout = FakeStripeCheckout
+    checkout.CheckoutSessionRequest = lambda **fields: types.SimpleNamespace(**fields)
+    checkout.CheckoutSessionResponse = checkout.CheckoutStatusResponse = types.SimpleNamespace
+    for name in ["emergentintegrations", "emergentintegrations.payments", "emergentintegrations.payments.stripe"]:
+        sys.modules[name] = types.ModuleType(name)
+    sys.modules[checkout.__name__] = checkout
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def free_seats(seat_map):
+    """Decode the seat map bitmap (seat n is bit (n-1) % 8 of byte (n-1) // 8)"""
+    occupancy = base64.b64decode(seat_map["occupancy"])
+    return [
+        seat for seat in range(1, seat_map["total_seats"] + 1)
+        if not (occupancy[(seat - 1) >> 3] >> ((seat - 1) & 7)) & 1
+    ]
+
+
+class BusBookingBenchmark:
+    def __init__(self, args):
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.db_name = f"bench_{uuid.uuid4().hex[:12]}"
+        self.server = None
+        self.users = []
+        self.routes = []
+        self.samples = {}
+        self.recording = False
+        self.flows_started = 0
+        self.flows_completed = 0
+        self.seat_conflicts = 0
+        self.wall_seconds = 0.0
+
+    def boot(self):
+        """Import server.py against the benchmark database and the fake Stripe client"""
+        os.environ["MONGO_URL"] = self.args.mongo_url
+        os.environ["DB_NAME"] = self.db_name
+        os.environ["BCRYPT_ROUNDS"] = str(self.args.bcrypt_rounds)
+        install_fake_stripe(self.args.stripe_latency_ms)
+        sys.path.insert(0, str(ROOT_DIR / "backend"))
+        import server
+        self.server = server
+
+    async def seed(self):
+        """Insert users, buses and confirmed bookings directly, with seat maps that match the bookings"""
+        server = self.server
+        rng = self.random
+        password = server.hash_password(BENCH_PASSWORD)
+
+        users = [
+            server.User(email=f"bench{i}@example.com", password=password, name=f"Bench User {i}").model_dump()
+            for i in range(self.args.users)
+        ]
+        await server.db.users.insert_many(users)
+        self.users = [{"id": user["id"], "email": user["email"], "name": user["name"]} for user in users]
+
+        today = datetime.now(timezone.utc).date()
+        buses = []
+        for i in range(self.args.buses):
+            route_from, route_to = rng.sample(CITIES, 2)
+            departure_date = (today + timedelta(days=rng.randint(0, 6))).isoformat()
+            departure_time = f"{rng.randint(5, 22):02d}:{rng.choice(['00', '15', '30', '45'])}"
+            bus = server.Bus(
+                bus_number=f"BENCH-{i:05d}", route_from=route_from, route_to=route_to,
+                departure_time=departure_time, arrival_time="23:59", total_seats=self.args.seats,
+                available_seats=self.args.seats, price=float(rng.randint(10, 90)), departure_date=departure_date,
+                departure_at=server.parse_departure(departure_date, departure_time),
+                **server.route_keys(route_from, route_to)
+            ).model_dump()
+            bus["seat_words"] = server.empty_seat_words(bus["total_seats"])
+            buses.append(bus)
+            self.routes.append((route_from, route_to, departure_date))
+
+        # Fill buses up to half their seats so flows still find free ones
+        bookings = []
+        next_seat = {bus["id"]: 1 for bus in buses}
+        for _ in range(self.args.bookings):
+            bus = rng.choice(buses)
+            count = rng.randint(1, 3)
+            first = next_seat[bus["id"]]
+            if first + count - 1 > bus["total_seats"] // 2:
+                continue
+            seats = list(range(first, first + count))
+            next_seat[bus["id"]] += count
+            user = rng.choice(self.users)
+            bookings.append(server.Booking(
+                user_id=user["id"], bus_id=bus["id"], seats=seats, total_amount=bus["price"] * count,
+                status="confirmed", payment_status="completed", passenger_name=user["name"],
+                passenger_email=user["email"], passenger_phone="555-0100"
+            ).model_dump())
+        for bus in buses:
+            taken = list(range(1, next_seat[bus["id"]]))
+            for word, mask in server.seat_masks(taken).items():
+                bus["seat_words"][word] = server.Int64(mask)
+            bus["available_seats"] = bus["total_seats"] - len(taken)
+
+        await server.db.buses.insert_many(buses)
+        if bookings:
+            await server.db.bookings.insert_many(bookings)
+        print(f"Seeded {len(users)} users, {len(buses)} buses, {len(bookings)} bookings into {self.db_name}")
+
+    async def request(self, client, method, endpoint, url, **kwargs):
+        """Send one request and record its latency under the route template"""
+        started = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        elapsed = time.perf_counter() - started
+        if self.recording:
+            sample = self.samples.setdefault(endpoint, {"latencies": [], "statuses": {}})
+            sample["latencies"].append(elapsed)
+            sample["statuses"][response.status_code] = sample["statuses"].get(response.status_code, 0) + 1
+        return response
+
+    async def login(self, client, user):
+        response = await self.request(
+            client, "POST", "POST /api/auth/login", "/api/auth/login",
+            json={"email": user["email"], "password": BENCH_PASSWORD}
+        )
+        response.raise_for_status()
+        user["headers"] = {"Authorization": f"Bearer {response.json()['token']}"}
+
+    async def run_flow(self, client):
+        """search -> bus -> seat map -> book -> pay -> poll status -> download ticket"""
+        rng = self.random
+        user = rng.choice(self.users)
+        headers = user["headers"]
+        route_from, route_to, date = rng.choice(self.routes)
+
+        response = await self.request(
+            client, "GET", "GET /api/buses/search", "/api/buses/search",
+            params={"route_from": route_from, "route_to": route_to, "date": date, "days": 1}
+        )
+        items = response.json()["items"] if response.status_code == 200 else []
+        if not items:
+            return False
+        bus_id = rng.choice(items)["id"]
+
+        await self.request(client, "GET", "GET /api/buses/{bus_id}", f"/api/buses/{bus_id}")
+        response = await self.request(client, "GET", "GET /api/buses/{bus_id}/seats", f"/api/buses/{bus_id}/seats")
+        if response.status_code != 200:
+            return False
+        available = free_seats(response.json())
+        if not available:
+            return False
+
+        response = await self.request(
+            client, "POST", "POST /api/bookings", "/api/bookings", headers=headers,
+            json={
+                "bus_id": bus_id, "seats": rng.sample(available, min(len(available), rng.randint(1, 3))),
+                "passenger_name": user["name"], "passenger_email": user["email"], "passenger_phone": "555-0100"
+            }
+        )
+        if response.status_code == 400:
+            self.seat_conflicts += 1
+            return False
+        if response.status_code != 200:
+            return False
+        booking_id = response.json()["id"]
+
+        response = await self.request(
+            client, "POST", "POST /api/payments/create-session", "/api/payments/create-session", headers=headers,
+            json={"booking_id": booking_id, "host_url": "http://bench.invalid"}
+        )
+        if response.status_code != 200:
+            return False
+        session_id = response.json()["session_id"]
+
+        response = await self.request(
+            client, "GET", "GET /api/payments/status/{session_id}", f"/api/payments/status/{session_id}", headers=headers
+        )
+        if response.status_code != 200 or response.json()["payment_status"] != "paid":
+            return False
+
+        response = await self.request(
+            client, "GET", "GET /api/bookings/{booking_id}/download", f"/api/bookings/{booking_id}/download",
+            headers=headers
+        )
+        return response.status_code == 200
+
+    async def drive(self, client, flows):
+        """Run the given number of flows across args.concurrency workers"""
+        remaining = [flows]
+
+        async def worker():
+            while remaining[0] > 0:
+                remaining[0] -= 1
+                self.flows_started += 1
+                try:
+                    if await self.run_flow(client):
+                        self.flows_completed += 1
+                except Exception as e:
+                    print(f"Flow failed: {e!r}")
+
+        await asyncio.gather(*[worker() for _ in range(self.args.concurrency)])
+
+    async def run(self):
+        import httpx
+
+        self.boot()
+        app = self.server.app
+        async with app.router.lifespan_context(app):
+            try:
+                await self.seed()
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+                    self.recording = True
+                    await asyncio.gather(*[self.login(client, user) for user in self.users[:self.args.login_users]])
+                    self.users = [user for user in self.users if "headers" in user]
+
+                    self.recording = False
+                    await self.drive(client, self.args.warmup)
+                    self.flows_started = self.flows_completed = self.seat_conflicts = 0
+
+                    self.recording = True
+                    started = time.perf_counter()
+                    await self.drive(client, self.args.flows)
+                    self.wall_seconds = time.perf_counter() - started
+            finally:
+                if not self.args.keep_db:
+                    await self.server.client.drop_database(self.db_name)
+        return self.report()
+
+    def report(self):
+        """Print a per-endpoint table and return the same numbers as a dict"""
+        results = {
+            "options": vars(self.args),
+            "wall_seconds": round(self.wall_seconds, 3),
+            "flows": self.flows_started,
+            "flows_completed": self.flows_completed,
+            "seat_conflicts": self.seat_conflicts,
+            "flows_per_second": round(self.flows_completed / self.wall_seconds, 2) if self.wall_seconds else 0.0,
+            "endpoints": {}
+        }
+        print("\n" + "=" * 110)
+        print(f"{'endpoint':<42}{'count':>8}{'errors':>8}{'req/s':>10}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}  (ms)")
+        for endpoint, sample in sorted(self.samples.items()):
+            latencies = sorted(sample["latencies"])
+            errors = sum(count for status, count in sample["statuses"].items() if status >= 500)
+            stats = {
+                "count": len(latencies),
+                "errors": errors,
+                "statuses": {str(status): count for status, count in sorted(sample["statuses"].items())},
+                "rps": round(len(latencies) / self.wall_seconds, 2) if self.wall_seconds else 0.0,
+                "mean_ms": round(sum(latencies) * 1000 / len(latencies), 2),
+                "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+                "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+                "p99_ms": round(percentile(latencies, 0.99) * 1000, 2)
+            }
+            results["endpoints"][endpoint] = stats
+            print(
+                f"{endpoint:<42}{stats['count']:>8}{errors:>8}{stats['rps']:>10}"
+                f"{stats['mean_ms']:>10}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}"
+            )
+        print("=" * 110)
+        print(
+            f"📊 {self.flows_completed}/{self.flows_started} flows completed in {results['wall_seconds']}s "
+            f"({results['flows_per_second']} flows/s, {self.seat_conflicts} seat conflicts)"
+        )
+        print("Note: login rows are measured before the timed window, so their req/s is not meaningful")
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the bus booking API in-process")
+    parser.add_argument("--mongo-url", default=os.environ.get("BENCH_MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--buses", type=int, default=100)
+    parser.add_argument("--seats", type=int, default=40)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--login-users", type=int, default=100, help="users that log in and drive flows")
+    parser.add_argument("--bookings", type=int, default=1000, help="confirmed bookings seeded before the run")
+    parser.add_argument("--flows", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=20, help="unrecorded flows run first")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--stripe-latency-ms", type=float, default=20, help="simulated Stripe round trip")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--keep-db", action="store_true", help="leave the benchmark database in place")
+    args = parser.parse_args()
+
+    results = asyncio.run(BusBookingBenchmark(args).run())
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,9 @@
 import requests
 import sys
 import json
+import io
+import base64
+import zipfile
 from datetime import datetime
 
 class BusBookingAPITester:
@@ -381,6 +384,199 @@ class BusBookingAPITester:
         )
         return success
 
+    def test_bus_hides_internal_fields(self, bus_id):
+        """Test that bus responses leave out server-only fields"""
+        if not bus_id:
+            self.log_test("Bus Hides Internal Fields", False, "No bus ID available")
+            return False
+            
+        internal = {"seat_words", "seat_version", "route_from_key", "route_to_key"}
+        success, response = self.run_test(
+            "Get Bus (Internal Fields)",
+            "GET",
+            f"buses/{bus_id}",
+            200
+        )
+        leaked = sorted(internal & response.keys()) if success else []
+        self.log_test("Bus Hides Internal Fields", success and not leaked, f"Leaked: {leaked}" if leaked else "")
+        return success and not leaked
+
+    def test_double_booking_rejected(self, bus_id):
+        """Test that seats already held can't be booked again"""
+        if not self.user_token or not bus_id:
+            self.log_test("Double Booking Rejected", False, "Missing user token or bus ID")
+            return False
+            
+        booking_data = {
+            "bus_id": bus_id,
+            "seats": [2, 3],
+            "passenger_name": "Second Passenger",
+            "passenger_email": "second@test.com",
+            "passenger_phone": "+1234567891"
+        }
+        
+        headers = {'Authorization': f'Bearer {self.user_token}'}
+        success, _ = self.run_test(
+            "Double Booking Rejected",
+            "POST",
+            "bookings",
+            400,
+            data=booking_data,
+            headers=headers
+        )
+        return success
+
+    def test_admin_buses_pagination(self):
+        """Test following next_cursor through admin bus pages"""
+        if not self.admin_token:
+            self.log_test("Admin Buses Pagination", False, "No admin token available")
+            return False
+            
+        headers = {'Authorization': f'Bearer {self.admin_token}'}
+        seen = []
+        cursor = None
+        for page_number in range(3):
+            endpoint = "admin/buses?limit=1" + (f"&cursor={cursor}" if cursor else "")
+            success, response = self.run_test(
+                f"Admin Buses Page {page_number + 1}",
+                "GET",
+                endpoint,
+                200,
+                headers=headers
+            )
+            if not success:
+                return False
+            seen.extend(bus['id'] for bus in response['items'])
+            cursor = response.get('next_cursor')
+            if not cursor:
+                break
+        
+        success = len(seen) == len(set(seen))
+        self.log_test("Admin Buses Pagination (No Repeats)", success, f"Bus IDs: {seen}")
+        
+        invalid, _ = self.run_test(
+            "Admin Buses (Invalid Cursor)",
+            "GET",
+            "admin/buses?cursor=not-a-cursor",
+            400,
+            headers=headers
+        )
+        return success and invalid
+
+    def test_admin_rollup_analytics(self):
+        """Test rollup-backed analytics and their rebuild"""
+        if not self.admin_token:
+            self.log_test("Admin Rollup Analytics", False, "No admin token available")
+            return False
+            
+        headers = {'Authorization': f'Bearer {self.admin_token}'}
+        results = [
+            self.run_test("Admin Rebuild Rollups", "POST", "admin/analytics/rebuild", 200, headers=headers)[0],
+            self.run_test("Admin Daily Analytics", "GET", "admin/analytics/daily?days=7", 200, headers=headers)[0],
+            self.run_test("Admin Bus Analytics", "GET", "admin/analytics/buses?days=7", 200, headers=headers)[0],
+            self.run_test("Admin Route Analytics", "GET", "admin/analytics/routes?days=7", 200, headers=headers)[0]
+        ]
+        return all(results)
+
+    def test_seat_map(self, bus_id, expected_available, occupied=()):
+        """Test seat map snapshot and its ETag"""
+        if not bus_id:
+            self.log_test("Seat Map", False, "No bus ID available")
+            return False
+            
+        url = f"{self.base_url}/api/buses/{bus_id}/seats"
+        try:
+            response = requests.get(url)
+            if response.status_code != 200:
+                self.log_test("Seat Map", False, f"Status: {response.status_code}, Expected: 200")
+                return False
+            
+            seat_map = response.json()
+            bitmap = int.from_bytes(base64.b64decode(seat_map['occupancy']), 'little')
+            taken = [seat for seat in range(1, seat_map['total_seats'] + 1) if bitmap >> (seat - 1) & 1]
+            success = seat_map['available_seats'] == expected_available and taken == sorted(occupied)
+            self.log_test(
+                "Seat Map",
+                success,
+                f"Available: {seat_map['available_seats']}, Expected: {expected_available}, Occupied: {taken}"
+            )
+            
+            cached = requests.get(url, headers={"If-None-Match": response.headers.get("ETag", "")})
+            self.log_test(
+                "Seat Map (If-None-Match)",
+                cached.status_code == 304,
+                f"Status: {cached.status_code}, Expected: 304"
+            )
+            return success and cached.status_code == 304
+        except Exception as e:
+            self.log_test("Seat Map", False, f"Exception: {str(e)}")
+            return False
+
+    def test_admin_export_bus(self, bus_id):
+        """Test exporting a bus's tickets as a zip"""
+        if not self.admin_token or not bus_id:
+            self.log_test("Admin Export Bus", False, "Missing admin token or bus ID")
+            return False
+            
+        headers = {'Authorization': f'Bearer {self.admin_token}'}
+        try:
+            link = requests.post(f"{self.base_url}/api/admin/buses/{bus_id}/export", headers=headers)
+            if link.status_code != 200:
+                self.log_test("Admin Export Bus", False, f"Link status: {link.status_code}, Expected: 200")
+                return False
+            
+            # The signed link is opened without the Authorization header, as the browser does
+            response = requests.get(f"{self.base_url}{link.json()['url']}")
+            if response.status_code != 200:
+                self.log_test("Admin Export Bus", False, f"Status: {response.status_code}, Expected: 200")
+                return False
+            
+            names = zipfile.ZipFile(io.BytesIO(response.content)).namelist()
+            success = names[-1] == "manifest.csv"
+            self.log_test("Admin Export Bus", success, f"Entries: {names}")
+            return success
+        except Exception as e:
+            self.log_test("Admin Export Bus", False, f"Exception: {str(e)}")
+            return False
+
+    def test_cancel_booking(self, booking_id):
+        """Test cancelling a pending booking"""
+        if not self.user_token or not booking_id:
+            self.log_test("Cancel Booking", False, "Missing user token or booking ID")
+            return False
+            
+        headers = {'Authorization': f'Bearer {self.user_token}'}
+        success, _ = self.run_test(
+            "Cancel Booking",
+            "DELETE",
+            f"bookings/{booking_id}",
+            200,
+            headers=headers
+        )
+        repeated, _ = self.run_test(
+            "Cancel Booking Again",
+            "DELETE",
+            f"bookings/{booking_id}",
+            400,
+            headers=headers
+        )
+        return success and repeated
+
+    def test_metrics(self):
+        """Test Prometheus metrics endpoint"""
+        try:
+            response = requests.get(f"{self.base_url}/api/metrics")
+            if response.status_code == 401:
+                self.log_test("Metrics", True, "Protected by METRICS_TOKEN")
+                return True
+            
+            success = response.status_code == 200 and "http_requests_total" in response.text
+            self.log_test("Metrics", success, f"Status: {response.status_code}, Expected: 200")
+            return success
+        except Exception as e:
+            self.log_test("Metrics", False, f"Exception: {str(e)}")
+            return False
+
     def run_all_tests(self):
         """Run all tests in sequence"""
         print("🚀 Starting Bus Booking API Tests...")
@@ -407,13 +603,20 @@ class BusBookingAPITester:
         bus_id = self.test_admin_create_bus()
         if bus_id:
             self.test_get_bus_details(bus_id)
+            self.test_bus_hides_internal_fields(bus_id)
+            self.test_seat_map(bus_id, 40)
             self.test_admin_update_bus(bus_id)
             
             # Test booking operations
             booking_id = self.test_create_booking(bus_id)
             if booking_id:
+                self.test_seat_map(bus_id, 43, occupied=[1, 2])
+                self.test_double_booking_rejected(bus_id)
                 self.test_get_user_bookings()
                 self.test_create_payment_session(booking_id)
+                self.test_admin_export_bus(bus_id)
+                self.test_cancel_booking(booking_id)
+                self.test_seat_map(bus_id, 45)
             
             # Clean up - delete test bus
             self.test_admin_delete_bus(bus_id)
@@ -423,6 +626,9 @@ class BusBookingAPITester:
         self.test_admin_get_all_buses()
         self.test_admin_get_all_bookings()
         self.test_admin_get_all_users()
+        self.test_admin_buses_pagination()
+        self.test_admin_rollup_analytics()
+        self.test_metrics()
         
         # Print results
         print("\n" + "=" * 50)
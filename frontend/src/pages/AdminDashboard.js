@@ -9,12 +9,14 @@ const AdminDashboard = ({ user, logout }) => {
   const [buses, setBuses] = useState([]);
   const [bookings, setBookings] = useState([]);
   const [users, setUsers] = useState([]);
+  const [nextCursors, setNextCursors] = useState({ buses: null, bookings: null, users: null });
   const [showBusForm, setShowBusForm] = useState(false);
   const [editingBus, setEditingBus] = useState(null);
   const [busForm, setBusForm] = useState({
     bus_number: '',
     route_from: '',
     route_to: '',
+    departure_date: '',
     departure_time: '',
     arrival_time: '',
     total_seats: 40,
@@ -43,40 +45,46 @@ const AdminDashboard = ({ user, logout }) => {
     }
   };
 
-  const fetchBuses = async () => {
+  const fetchBuses = async (cursor = null) => {
     try {
       const token = localStorage.getItem('token');
-      const response = await fetch(`${process.env.REACT_APP_BACKEND_URL}/api/admin/buses`, {
+      const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+      const response = await fetch(`${process.env.REACT_APP_BACKEND_URL}/api/admin/buses${query}`, {
         headers: { 'Authorization': `Bearer ${token}` }
       });
       const data = await response.json();
-      setBuses(data);
+      setBuses(cursor ? (prev) => [...prev, ...data.items] : data.items);
+      setNextCursors((prev) => ({ ...prev, buses: data.next_cursor }));
     } catch (error) {
       toast.error('Failed to fetch buses');
     }
   };
 
-  const fetchBookings = async () => {
+  const fetchBookings = async (cursor = null) => {
     try {
       const token = localStorage.getItem('token');
-      const response = await fetch(`${process.env.REACT_APP_BACKEND_URL}/api/admin/bookings`, {
+      const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+      const response = await fetch(`${process.env.REACT_APP_BACKEND_URL}/api/admin/bookings${query}`, {
         headers: { 'Authorization': `Bearer ${token}` }
       });
       const data = await response.json();
-      setBookings(data);
+      setBookings(cursor ? (prev) => [...prev, ...data.items] : data.items);
+      setNextCursors((prev) => ({ ...prev, bookings: data.next_cursor }));
     } catch (error) {
       toast.error('Failed to fetch bookings');
     }
   };
 
-  const fetchUsers = async () => {
+  const fetchUsers = async (cursor = null) => {
     try {
       const token = localStorage.getItem('token');
-      const response = await fetch(`${process.env.REACT_APP_BACKEND_URL}/api/admin/users`, {
+      const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+      const response = await fetch(`${process.env.REACT_APP_BACKEND_URL}/api/admin/users${query}`, {
         headers: { 'Authorization': `Bearer ${token}` }
       });
       const data = await response.json();
-      setUsers(data);
+      setUsers(cursor ? (prev) => [...prev, ...data.items] : data.items);
+      setNextCursors((prev) => ({ ...prev, users: data.next_cursor }));
     } catch (error) {
       toast.error('Failed to fetch users');
     }
@@ -96,7 +104,7 @@ const AdminDashboard = ({ user, logout }) => {
           'Content-Type': 'application/json',
           'Authorization': `Bearer ${token}`
         },
-        body: JSON.stringify(busForm)
+        body: JSON.stringify({ ...busForm, departure_date: busForm.departure_date || null })
       });
 
       if (response.ok) {
@@ -107,6 +115,7 @@ const AdminDashboard = ({ user, logout }) => {
           bus_number: '',
           route_from: '',
           route_to: '',
+          departure_date: '',
           departure_time: '',
           arrival_time: '',
           total_seats: 40,
@@ -144,12 +153,33 @@ const AdminDashboard = ({ user, logout }) => {
     }
   };
 
+  const handleExportBus = async (bus) => {
+    try {
+      const token = localStorage.getItem('token');
+      const response = await fetch(`${process.env.REACT_APP_BACKEND_URL}/api/admin/buses/${bus.id}/export`, {
+        method: 'POST',
+        headers: { 'Authorization': `Bearer ${token}` }
+      });
+
+      if (response.ok) {
+        // The link is signed and short-lived, so the browser downloads the zip itself as it streams
+        const { url } = await response.json();
+        window.location.assign(`${process.env.REACT_APP_BACKEND_URL}${url}`);
+      } else {
+        toast.error('Failed to export tickets');
+      }
+    } catch (error) {
+      toast.error('An error occurred');
+    }
+  };
+
   const handleEditBus = (bus) => {
     setEditingBus(bus);
     setBusForm({
       bus_number: bus.bus_number,
       route_from: bus.route_from,
       route_to: bus.route_to,
+      departure_date: bus.departure_date || '',
       departure_time: bus.departure_time,
       arrival_time: bus.arrival_time,
       total_seats: bus.total_seats,
@@ -309,6 +339,9 @@ const AdminDashboard = ({ user, logout }) => {
                       <button className="book-btn" onClick={() => handleEditBus(bus)} data-testid={`edit-bus-${bus.id}`}>
                         Edit
                       </button>
+                      <button className="book-btn" onClick={() => handleExportBus(bus)} data-testid={`export-bus-${bus.id}`}>
+                        Export
+                      </button>
                       <button
                         className="book-btn"
                         onClick={() => handleDeleteBus(bus.id)}
@@ -322,6 +355,11 @@ const AdminDashboard = ({ user, logout }) => {
                 </div>
               ))}
             </div>
+            {nextCursors.buses && (
+              <button className="nav-btn" onClick={() => fetchBuses(nextCursors.buses)} style={{ marginTop: '1.5rem' }} data-testid="load-more-buses">
+                Load More
+              </button>
+            )}
           </div>
         )}
 
@@ -365,6 +403,11 @@ const AdminDashboard = ({ user, logout }) => {
                 </tbody>
               </table>
             </div>
+            {nextCursors.bookings && (
+              <button className="nav-btn" onClick={() => fetchBookings(nextCursors.bookings)} style={{ marginTop: '1.5rem' }} data-testid="load-more-bookings">
+                Load More
+              </button>
+            )}
           </div>
         )}
 
@@ -404,6 +447,11 @@ const AdminDashboard = ({ user, logout }) => {
                 </tbody>
               </table>
             </div>
+            {nextCursors.users && (
+              <button className="nav-btn" onClick={() => fetchUsers(nextCursors.users)} style={{ marginTop: '1.5rem' }} data-testid="load-more-users">
+                Load More
+              </button>
+            )}
           </div>
         )}
       </div>
@@ -458,6 +506,15 @@ const AdminDashboard = ({ user, logout }) => {
                     data-testid="route-to-input"
                   />
                 </div>
+                <div className="form-group">
+                  <label>Departure Date</label>
+                  <input
+                    type="date"
+                    value={busForm.departure_date}
+                    onChange={(e) => setBusForm({ ...busForm, departure_date: e.target.value })}
+                    data-testid="departure-date-input"
+                  />
+                </div>
                 <div className="form-group">
                   <label>Departure Time</label>
                   <input
@@ -13,9 +13,15 @@ const BookingPage = ({ user, logout }) => {
     phone: ''
   });
   const [loading, setLoading] = useState(true);
+  const [occupancy, setOccupancy] = useState(null);
 
   useEffect(() => {
     fetchBus();
+    fetchSeats();
+    // Seat changes are pushed as they happen; EventSource reconnects on its own
+    const source = new EventSource(`${process.env.REACT_APP_BACKEND_URL}/api/buses/${busId}/seats/stream`);
+    source.addEventListener('seats', (event) => applySeatMap(JSON.parse(event.data)));
+    return () => source.close();
   }, [busId]);
 
   const fetchBus = async () => {
@@ -30,6 +36,25 @@ const BookingPage = ({ user, logout }) => {
     }
   };
 
+  const fetchSeats = async () => {
+    try {
+      const response = await fetch(`${process.env.REACT_APP_BACKEND_URL}/api/buses/${busId}/seats`);
+      if (!response.ok) return;
+      applySeatMap(await response.json());
+    } catch (error) {
+      // Keep showing the last known seat map
+    }
+  };
+
+  const applySeatMap = (seatMap) => {
+    setOccupancy(Uint8Array.from(atob(seatMap.occupancy), (c) => c.charCodeAt(0)));
+  };
+
+  const isSeatBooked = (seatNumber) => {
+    if (!occupancy) return false;
+    return ((occupancy[(seatNumber - 1) >> 3] >> ((seatNumber - 1) & 7)) & 1) === 1;
+  };
+
   const toggleSeat = (seatNumber) => {
     if (selectedSeats.includes(seatNumber)) {
       setSelectedSeats(selectedSeats.filter(s => s !== seatNumber));
@@ -95,6 +120,7 @@ const BookingPage = ({ user, logout }) => {
         }
       } else {
         toast.error(booking.detail || 'Booking failed');
+        fetchSeats();
       }
     } catch (error) {
       toast.error('An error occurred');
@@ -110,7 +136,6 @@ const BookingPage = ({ user, logout }) => {
   }
 
   const totalSeats = bus.total_seats || 40;
-  const bookedSeatsCount = totalSeats - bus.available_seats;
 
   return (
     <div>
@@ -161,7 +186,7 @@ const BookingPage = ({ user, logout }) => {
             {/* Seat Grid */}
             <div className="seat-grid" data-testid="seat-grid">
               {Array.from({ length: totalSeats }, (_, i) => i + 1).map((seatNumber) => {
-                const isBooked = seatNumber <= bookedSeatsCount;
+                const isBooked = isSeatBooked(seatNumber);
                 const isSelected = selectedSeats.includes(seatNumber);
 
                 return (
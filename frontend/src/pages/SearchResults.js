@@ -7,6 +7,7 @@ const SearchResults = ({ user, logout }) => {
   const navigate = useNavigate();
   const [buses, setBuses] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
 
   const from = searchParams.get('from');
   const to = searchParams.get('to');
@@ -14,14 +15,15 @@ const SearchResults = ({ user, logout }) => {
 
   useEffect(() => {
     fetchBuses();
-  }, [from, to]);
+  }, [from, to, date]);
 
-  const fetchBuses = async () => {
+  const fetchBuses = async (cursor = null) => {
     try {
-      const url = `${process.env.REACT_APP_BACKEND_URL}/api/buses/search?route_from=${from}&route_to=${to}`;
+      const url = `${process.env.REACT_APP_BACKEND_URL}/api/buses/search?route_from=${from}&route_to=${to}${date ? `&date=${date}` : ''}${cursor ? `&cursor=${encodeURIComponent(cursor)}` : ''}`;
       const response = await fetch(url);
       const data = await response.json();
-      setBuses(data);
+      setBuses(cursor ? (prev) => [...prev, ...data.items] : data.items);
+      setNextCursor(data.next_cursor);
     } catch (error) {
       toast.error('Failed to fetch buses');
     } finally {
@@ -140,6 +142,11 @@ const SearchResults = ({ user, logout }) => {
                 </div>
               </div>
             ))}
+            {nextCursor && (
+              <button className="nav-btn" onClick={() => fetchBuses(nextCursor)} style={{ alignSelf: 'center' }} data-testid="load-more-buses">
+                Load More
+              </button>
+            )}
           </div>
         )}
       </div>
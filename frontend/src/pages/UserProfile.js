@@ -6,21 +6,24 @@ const UserProfile = ({ user, logout }) => {
   const navigate = useNavigate();
   const [bookings, setBookings] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
 
   useEffect(() => {
     fetchBookings();
   }, []);
 
-  const fetchBookings = async () => {
+  const fetchBookings = async (cursor = null) => {
     try {
       const token = localStorage.getItem('token');
-      const response = await fetch(`${process.env.REACT_APP_BACKEND_URL}/api/bookings`, {
+      const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+      const response = await fetch(`${process.env.REACT_APP_BACKEND_URL}/api/bookings${query}`, {
         headers: {
           'Authorization': `Bearer ${token}`
         }
       });
       const data = await response.json();
-      setBookings(data);
+      setBookings(cursor ? (prev) => [...prev, ...data.items] : data.items);
+      setNextCursor(data.next_cursor);
     } catch (error) {
       toast.error('Failed to fetch bookings');
     } finally {
@@ -255,6 +258,11 @@ const UserProfile = ({ user, logout }) => {
                 </div>
               </div>
             ))}
+            {nextCursor && (
+              <button className="nav-btn" onClick={() => fetchBookings(nextCursor)} style={{ alignSelf: 'center' }} data-testid="load-more-bookings">
+                Load More
+              </button>
+            )}
           </div>
         )}
       </div>
@@ -0,0 +1,66 @@
+import asyncio
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import httpx
+import pytest
+
+# Tests that take the `run` fixture use the MongoDB configured in backend/.env, in a throwaway database
+# dropped afterwards; the rest exercise pure helpers and need no database. load_dotenv never overrides
+# a variable that is already set.
+TEST_DB_NAME = f"busgo_test_{uuid.uuid4().hex[:12]}"
+os.environ['DB_NAME'] = TEST_DB_NAME
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+import server  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def run():
+    # Motor binds its client to the first event loop that uses it, so every test shares one loop
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(server.db.command("ping"))
+    except Exception as e:
+        loop.close()
+        pytest.skip(f"MongoDB not reachable: {e}")
+    # Startup hooks don't run here; some paths rely on unique indexes (e.g. the webhook ledger)
+    # and on knowing whether transactions are available
+    loop.run_until_complete(server.ensure_indexes())
+    loop.run_until_complete(server.detect_transactions())
+    yield loop.run_until_complete
+    loop.run_until_complete(server.client.drop_database(TEST_DB_NAME))
+    loop.close()
+
+
+@pytest.fixture
+def api_client():
+    # ASGI transport skips the startup hooks, so no sweeper or job workers run during the tests
+    def connect(**kwargs):
+        transport = httpx.ASGITransport(app=server.app, **kwargs)
+        return httpx.AsyncClient(transport=transport, base_url="http://test")
+    return connect
+
+
+@pytest.fixture
+def insert_bus():
+    async def insert(route_from="Test City A", total_seats=70, departure_at=None):
+        bus = server.Bus(
+            bus_number=f"TEST{uuid.uuid4().hex[:6]}",
+            route_from=route_from,
+            route_to="Test City B",
+            departure_time="09:00",
+            arrival_time="15:00",
+            total_seats=total_seats,
+            available_seats=total_seats,
+            price=10.0,
+            departure_at=departure_at,
+            **server.route_keys(route_from, "Test City B")
+        )
+        document = bus.model_dump()
+        document['seat_words'] = server.empty_seat_words(total_seats)
+        await server.db.buses.insert_one(document)
+        return bus.id
+    return insert
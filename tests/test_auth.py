@@ -0,0 +1,22 @@
+import asyncio
+import uuid
+
+import server
+
+
+def test_concurrent_registrations_for_one_email(run, monkeypatch, api_client):
+    # Cheap hashing keeps the two requests overlapping between the lookup and the insert
+    monkeypatch.setattr(server, "BCRYPT_ROUNDS", 4)
+    email = f"race-{uuid.uuid4().hex[:8]}@example.com"
+
+    async def register_twice():
+        async with api_client() as client:
+            return await asyncio.gather(*[
+                client.post("/api/auth/register", json={"email": email, "password": "secret123", "name": "Racer"})
+                for _ in range(2)
+            ])
+
+    responses = run(register_twice())
+    assert sorted(response.status_code for response in responses) == [200, 400]
+    assert [response.json()['detail'] for response in responses if response.status_code == 400] == ["Email already registered"]
+    assert run(server.db.users.count_documents({"email": email})) == 1
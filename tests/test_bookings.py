@@ -0,0 +1,29 @@
+import uuid
+
+import server
+
+
+def test_cancel_releases_seats_once(run, insert_bus, api_client):
+    bus_id = run(insert_bus())
+    user_id = str(uuid.uuid4())
+    run(server.db.users.insert_one({
+        "id": user_id, "email": f"{user_id}@example.com", "name": "Rider", "role": "user", "password": "-"
+    }))
+    run(server.claim_seats(bus_id, [1, 2]))
+    booking_id = str(uuid.uuid4())
+    run(server.db.bookings.insert_one({
+        "id": booking_id, "bus_id": bus_id, "user_id": user_id, "seats": [1, 2], "total_amount": 20.0,
+        "status": "pending", "payment_status": "pending", "booking_date": "2030-01-01T10:00:00+00:00"
+    }))
+    headers = {"Authorization": f"Bearer {server.create_token(user_id, f'{user_id}@example.com', 'user')}"}
+
+    async def cancel_twice():
+        async with api_client() as client:
+            return [await client.delete(f"/api/bookings/{booking_id}", headers=headers) for _ in range(2)]
+
+    first, second = run(cancel_twice())
+    assert first.status_code == 200
+    assert second.status_code == 400
+    assert second.json()['detail'] == "Cannot cancel cancelled booking"
+    bus = run(server.db.buses.find_one({"id": bus_id}))
+    assert bus['available_seats'] == 70
@@ -0,0 +1,56 @@
+import csv
+import io
+import uuid
+import zipfile
+
+import pytest
+
+import server
+
+
+def test_export_link_is_bound_to_its_bus():
+    token = server.create_export_token("bus-1", "admin-1")
+    assert server.decode_export_token(token, "bus-1")['user_id'] == "admin-1"
+    with pytest.raises(server.HTTPException) as error:
+        server.decode_export_token(token, "bus-2")
+    assert error.value.status_code == 401
+
+
+def test_export_and_login_tokens_are_not_interchangeable():
+    login = server.create_token("admin-1", "admin@example.com", "admin")
+    with pytest.raises(server.HTTPException):
+        server.decode_export_token(login, "bus-1")
+    with pytest.raises(server.HTTPException):
+        server.decode_token(server.create_export_token("bus-1", "admin-1"))
+
+
+def test_export_streams_tickets_then_manifest(run, monkeypatch, insert_bus):
+    bus_id = run(insert_bus())
+    bookings = [
+        {
+            "id": f"booking-{n}-{uuid.uuid4().hex[:6]}", "bus_id": bus_id, "user_id": "user-1", "seats": [n + 2, n],
+            "total_amount": 20.0, "status": "confirmed", "payment_status": "completed",
+            "passenger_name": f"Passenger {n}", "passenger_email": "p@example.com", "passenger_phone": "555",
+            "booking_date": f"2030-01-0{n}T10:00:00+00:00"
+        }
+        for n in (1, 2, 3)
+    ]
+    run(server.db.bookings.insert_many([dict(booking) for booking in bookings]))
+
+    async def load_ticket(booking, bus, fingerprint=None):
+        return f"pdf {booking['id']}".encode()
+
+    async def export():
+        bus = await server.db.buses.find_one({"id": bus_id}, {"_id": 0})
+        return b"".join([chunk async for chunk in server.stream_bus_export(bus)])
+
+    monkeypatch.setattr(server, "load_ticket", load_ticket)
+    archive = zipfile.ZipFile(io.BytesIO(run(export())))
+    names = archive.namelist()
+    assert names == [f"tickets/ticket_{booking['id']}.pdf" for booking in bookings] + ["manifest.csv"]
+    assert archive.read(names[0]) == f"pdf {bookings[0]['id']}".encode()
+
+    rows = list(csv.reader(io.StringIO(archive.read("manifest.csv").decode())))
+    assert rows[0] == server.MANIFEST_COLUMNS
+    assert rows[1] == [bookings[0]['id'], "Passenger 1", "p@example.com", "555", "1 3", "20.00", "2030-01-01"]
+    assert len(rows) == 4
@@ -0,0 +1,72 @@
+import server
+
+
+def test_histogram_buckets_are_cumulative():
+    metrics = server.Metrics()
+    for seconds in (0.0005, 0.003, 0.003, 20.0):
+        metrics.observe_request("GET", "/api/buses/{bus_id}", 200, seconds, 2)
+    lines = metrics.render().splitlines()
+
+    def bucket(le):
+        prefix = f'http_request_duration_seconds_bucket{{method="GET",route="/api/buses/{{bus_id}}",le="{le}"}} '
+        return int(next(line for line in lines if line.startswith(prefix)).rsplit(" ", 1)[1])
+
+    assert bucket(0.001) == 1
+    assert bucket(0.0025) == 1
+    assert bucket(0.005) == 3
+    assert bucket(10.0) == 3
+    # Observations past the last bound only show up in +Inf
+    assert bucket("+Inf") == 4
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/buses/{bus_id}"} 4' in lines
+    assert 'http_requests_total{method="GET",route="/api/buses/{bus_id}",status="200"} 4' in lines
+    assert 'http_request_mongo_commands_bucket{method="GET",route="/api/buses/{bus_id}",le="2"} 4' in lines
+
+
+def test_command_failures_are_counted():
+    metrics = server.Metrics()
+    metrics.observe_command("bookings", "insert", 0.002)
+    metrics.observe_command("bookings", "insert", 0.002, failed=True)
+    lines = metrics.render().splitlines()
+    assert 'mongo_command_duration_seconds_count{collection="bookings",command="insert"} 2' in lines
+    assert 'mongo_command_failures_total{collection="bookings",command="insert"} 1' in lines
+
+
+def test_label_values_are_escaped():
+    assert server.prometheus_labels({"route": 'a"b\\c\nd'}) == 'route="a\\"b\\\\c\\nd"'
+
+
+def test_requests_are_timed_until_the_last_body_chunk(monkeypatch):
+    monkeypatch.setattr(server, "metrics", server.Metrics())
+
+    async def streaming_app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"a", "more_body": True})
+        await server.asyncio.sleep(0.05)
+        await send({"type": "http.response.body", "body": b"b"})
+
+    async def receive():
+        return {"type": "http.request"}
+
+    async def send(message):
+        pass
+
+    middleware = server.RequestMetricsMiddleware(streaming_app)
+    server.asyncio.run(middleware({"type": "http", "method": "GET"}, receive, send))
+    histogram = server.metrics.request_latency[("GET", "unmatched")]
+    assert histogram.count == 1
+    assert histogram.sum >= 0.05
+    assert server.metrics.request_count == {("GET", "unmatched", 200): 1}
+
+
+def test_failed_requests_are_counted_as_errors(monkeypatch):
+    monkeypatch.setattr(server, "metrics", server.Metrics())
+
+    async def failing_app(scope, receive, send):
+        raise RuntimeError("boom")
+
+    middleware = server.RequestMetricsMiddleware(failing_app)
+    try:
+        server.asyncio.run(middleware({"type": "http", "method": "POST"}, None, None))
+    except RuntimeError:
+        pass
+    assert server.metrics.request_count == {("POST", "unmatched", 500): 1}
@@ -0,0 +1,58 @@
+import uuid
+from datetime import datetime
+
+import pytest
+
+import server
+
+SORT = [("departure_at", server.ASCENDING), ("id", server.ASCENDING)]
+
+
+def test_cursor_round_trip():
+    values = [datetime(2030, 1, 1, 9), "bus-1"]
+    assert server.decode_cursor(server.encode_cursor(values), 2) == values
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", server.encode_cursor(["only-one"]), server.encode_cursor({"a": 1})])
+def test_invalid_cursor_is_rejected(cursor):
+    with pytest.raises(server.HTTPException) as error:
+        server.decode_cursor(cursor, 2)
+    assert error.value.status_code == 400
+
+
+def test_keyset_filter_is_lexicographic():
+    departure = datetime(2030, 1, 1, 9)
+    assert server.keyset_filter(SORT, [departure, "b"]) == {"$or": [
+        {"departure_at": {"$gt": departure}},
+        {"departure_at": departure, "id": {"$gt": "b"}}
+    ]}
+
+
+def test_after_value_handles_null():
+    # Null sorts first: ascending after null is any non-null, descending after null is nothing
+    assert server.after_value("departure_at", server.ASCENDING, None) == {"departure_at": {"$ne": None}}
+    assert server.after_value("departure_at", server.DESCENDING, None) == {"departure_at": {"$in": []}}
+    assert server.after_value("created_at", server.DESCENDING, "2030") == {
+        "$or": [{"created_at": {"$lt": "2030"}}, {"created_at": None}]
+    }
+
+
+def test_keyset_cursor_round_trip(run, insert_bus):
+    # Daily services (no departure_at) and ties on departure_at both have to page cleanly
+    route_from = f"Cursor {uuid.uuid4().hex[:8]}"
+    departures = [None, None, datetime(2030, 1, 1, 9), datetime(2030, 1, 1, 9), datetime(2030, 1, 2, 9)]
+    for departure_at in departures:
+        run(insert_bus(route_from, departure_at=departure_at))
+
+    query = {"route_from_key": server.normalize_city(route_from)}
+    expected = [bus['id'] for bus in run(server.db.buses.find(query).sort(SORT).to_list(None))]
+
+    seen, cursor = [], None
+    while True:
+        page = run(server.paginate(server.db.buses, query, server.BUS_PROJECTION, SORT, cursor, 2))
+        seen.extend(bus['id'] for bus in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+        assert server.decode_cursor(cursor, len(SORT)) == [page["items"][-1].get(field) for field, _ in SORT]
+    assert seen == expected
@@ -0,0 +1,59 @@
+import uuid
+
+import server
+
+
+def booking(**fields):
+    return {
+        "id": f"booking-{uuid.uuid4().hex[:8]}", "bus_id": "bus-1", "seats": [1, 2], "total_amount": 20.0,
+        "status": "confirmed", "payment_status": "completed", "booking_date": "2030-01-01T23:59:00+00:00", **fields
+    }
+
+
+def test_events_are_credited_to_the_booking_day():
+    assert server.booking_day(booking()) == "2030-01-01"
+    kind, payload = server.confirmation_jobs(booking(id="booking-1"))[0]
+    assert kind == "record_confirmation"
+    assert payload == {"bus_id": "bus-1", "seats": 2, "revenue": 20.0, "day": "2030-01-01", "booking_id": "booking-1"}
+
+
+def test_rollup_window_includes_today():
+    today = server.datetime.now(server.timezone.utc).strftime("%Y-%m-%d")
+    assert server.rollup_window(1) == {"day": {"$gte": today}}
+
+
+def test_rebuild_matches_live_rollups(run):
+    bus_id = f"bus-{uuid.uuid4().hex[:8]}"
+    confirmed = booking(bus_id=bus_id)
+    cancelled = booking(bus_id=bus_id, seats=[3], total_amount=10.0, status="cancelled", payment_status="pending",
+                        booking_date="2030-01-02T08:00:00+00:00")
+    run(server.db.bookings.insert_many([dict(confirmed), dict(cancelled)]))
+
+    # What the live paths record for these two bookings
+    run(server.record_rollup(bus_id, server.booking_day(confirmed), bookings=1))
+    run(server.record_rollup(bus_id, server.booking_day(cancelled), bookings=1))
+    run(server.record_rollup(bus_id, server.booking_day(confirmed), confirmed=1, seats_sold=2, revenue=20.0))
+    run(server.record_rollup(bus_id, server.booking_day(cancelled), cancelled=1))
+
+    def rollups():
+        docs = run(server.db.booking_rollups.find({"bus_id": bus_id}, {"_id": 0}).sort("day", 1).to_list(None))
+        return [{field: doc.get(field, 0) for field in ["day", *server.ROLLUP_FIELDS]} for doc in docs]
+
+    live = rollups()
+    run(server.rebuild_rollups({}))
+    assert rollups() == live
+    assert [doc["day"] for doc in live] == ["2030-01-01", "2030-01-02"]
+
+
+def test_rerun_confirmation_counts_once(run):
+    bus_id = f"bus-{uuid.uuid4().hex[:8]}"
+    confirmed = booking(bus_id=bus_id)
+    run(server.db.bookings.insert_one(dict(confirmed)))
+    kind, payload = server.confirmation_jobs(confirmed)[0]
+
+    # Jobs are delivered at least once
+    run(server.record_confirmation(**payload))
+    run(server.record_confirmation(**payload))
+
+    rollup = run(server.db.booking_rollups.find_one({"bus_id": bus_id, "day": "2030-01-01"}))
+    assert (rollup['confirmed'], rollup['seats_sold'], rollup['revenue']) == (1, 2, 20.0)
@@ -0,0 +1,71 @@
+from datetime import datetime
+
+import server
+
+BUS = {
+    "id": "bus-1", **server.route_keys("São Paulo", "Rio de Janeiro"),
+    "departure_at": datetime(2030, 1, 10, 8, 30)
+}
+
+
+def key(route_from=None, route_to=None, date=None, days=0):
+    return server.search_cache_key(route_from, route_to, date, days, None, server.PAGE_SIZE)
+
+
+def test_route_prefixes_match_like_the_search_filter():
+    assert server.search_matches_bus(key(), BUS)
+    assert server.search_matches_bus(key("sao"), BUS)
+    assert server.search_matches_bus(key("  SÃO  paulo", "rio"), BUS)
+    assert not server.search_matches_bus(key("paulo"), BUS)
+    assert not server.search_matches_bus(key("sao", "santos"), BUS)
+
+
+def test_date_window_spans_days_either_side():
+    assert server.search_matches_bus(key(date="2030-01-10"), BUS)
+    assert not server.search_matches_bus(key(date="2030-01-11"), BUS)
+    assert not server.search_matches_bus(key(date="2030-01-09"), BUS)
+    assert server.search_matches_bus(key(date="2030-01-11", days=1), BUS)
+    assert server.search_matches_bus(key(date="2030-01-09", days=1), BUS)
+    # Buses without a departure date run every day
+    assert server.search_matches_bus(key(date="2030-06-01"), {**BUS, "departure_at": None})
+
+
+def test_invalidating_a_bus_drops_only_pages_it_could_appear_in():
+    cache = server.CountingCache(10, 60)
+    cache.set(key("sao"), {"items": []})
+    cache.set(key("santos"), {"items": []})
+    cache.set(key(date="2030-01-10"), {"items": []})
+    cache.set(key(date="2030-02-10"), {"items": []})
+
+    cache.discard_where(lambda cached, page: server.search_matches_bus(cached, BUS))
+    assert set(cache.entries) == {key("santos"), key(date="2030-02-10")}
+
+
+def test_fill_is_skipped_after_an_invalidation_it_depends_on():
+    clock = server.InvalidationClock()
+    clock.invalidate("bus-1")
+    started = clock.tick
+    assert not clock.changed_since(started, ["bus-1"], catalogue=True)
+
+    # A seat change only affects fills that include that bus
+    clock.invalidate("bus-2")
+    assert clock.changed_since(started, ["bus-2"])
+    assert not clock.changed_since(started, ["bus-1"], catalogue=True)
+
+    # A catalogue write can add a bus to any search page
+    clock.invalidate("bus-3", catalogue=True)
+    assert clock.changed_since(started, [], catalogue=True)
+    assert not clock.changed_since(started, ["bus-1"])
+
+
+def test_seat_map_cache_keeps_the_newest_version(monkeypatch):
+    monkeypatch.setattr(server, "seat_map_cache", server.CountingCache(10, 60))
+
+    def snapshot(version):
+        return {"etag": f'"bus-1-{version}"', "body": {"bus_id": "bus-1", "version": version}}
+
+    server.cache_seat_map(snapshot(2))
+    server.cache_seat_map(snapshot(1))
+    assert server.seat_map_cache.get("bus-1")["body"]["version"] == 2
+    server.cache_seat_map(snapshot(3))
+    assert server.seat_map_cache.get("bus-1")["body"]["version"] == 3
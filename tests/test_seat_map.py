@@ -0,0 +1,29 @@
+import base64
+
+import server
+
+
+def seat_bus(seats, total_seats=70):
+    words = server.empty_seat_words(total_seats)
+    for word, mask in server.seat_masks(seats).items():
+        words[word] |= mask
+    return {
+        "id": "bus-1", "total_seats": total_seats, "available_seats": total_seats - len(seats),
+        "seat_words": words, "seat_version": 3
+    }
+
+
+def test_snapshot_packs_seats_little_endian():
+    snapshot = server.seat_map_snapshot(seat_bus([1, 9, 64, 70]))
+    assert snapshot['etag'] == '"bus-1-3"'
+    bitmap = base64.b64decode(snapshot['body']['occupancy'])
+    # Seat n is bit (n - 1) % 8 of byte (n - 1) // 8
+    assert len(bitmap) == 9
+    assert [n for n in range(1, 71) if bitmap[(n - 1) // 8] >> ((n - 1) % 8) & 1] == [1, 9, 64, 70]
+    assert snapshot['body']['available_seats'] == 66
+
+
+def test_snapshot_of_an_empty_bus():
+    body = server.seat_map_snapshot({**seat_bus([]), "seat_version": 0})['body']
+    assert base64.b64decode(body['occupancy']) == bytes(9)
+    assert body['version'] == 0
@@ -0,0 +1,75 @@
+import asyncio
+import uuid
+
+import server
+
+INTERNAL_BUS_FIELDS = {"seat_words", "seat_version", "route_from_key", "route_to_key"}
+
+
+def test_seat_masks_span_words():
+    # Seat 63 is the last bit of word 0, seat 64 the first bit of word 1
+    assert server.seat_masks([1, 63, 64]) == {0: 1 | 1 << 62, 1: 1}
+    assert len(server.empty_seat_words(126)) == 2
+    assert len(server.empty_seat_words(127)) == 3
+
+
+def test_occupied_seats_round_trip():
+    seats = [1, 2, 63, 64, 100]
+    words = [0] * 2
+    for word, mask in server.seat_masks(seats).items():
+        words[word] |= mask
+    assert server.occupied_seats(words) == seats
+
+
+def test_bus_internal_fields_are_excluded():
+    assert set(server.BUS_PROJECTION) == {"_id"} | INTERNAL_BUS_FIELDS
+    assert not any(server.BUS_PROJECTION.values())
+
+
+def test_claim_and_release_seats(run, insert_bus):
+    bus_id = run(insert_bus())
+
+    # Seats 1 and 64 live in different bitmap words
+    bus = run(server.claim_seats(bus_id, [1, 64]))
+    assert bus['available_seats'] == 68
+    assert server.occupied_seats(bus['seat_words']) == [1, 64]
+
+    assert run(server.claim_seats(bus_id, [64, 65])) is None
+    assert run(server.claim_seats(bus_id, [71])) is None
+
+    assert run(server.release_seats(bus_id, [1, 64]))
+    # A repeated release must not free seats someone else has claimed since
+    assert not run(server.release_seats(bus_id, [1, 64]))
+
+    bus = run(server.db.buses.find_one({"id": bus_id}))
+    assert bus['available_seats'] == 70
+    assert server.occupied_seats(bus['seat_words']) == []
+
+
+def test_concurrent_claims_for_one_seat(run, insert_bus):
+    bus_id = run(insert_bus())
+
+    async def claim_twice():
+        return await asyncio.gather(server.claim_seats(bus_id, [5]), server.claim_seats(bus_id, [5, 6]))
+
+    results = run(claim_twice())
+    assert sum(bus is not None for bus in results) == 1
+    bus = run(server.db.buses.find_one({"id": bus_id}))
+    assert bus['available_seats'] == 70 - len(server.occupied_seats(bus['seat_words']))
+
+
+def test_bus_responses_hide_internal_fields(run, insert_bus, api_client):
+    route_from = f"Public {uuid.uuid4().hex[:8]}"
+    bus_id = run(insert_bus(route_from))
+
+    async def fetch():
+        async with api_client() as client:
+            bus = await client.get(f"/api/buses/{bus_id}")
+            search = await client.get("/api/buses/search", params={"route_from": route_from})
+        return bus.json(), search.json()
+
+    bus, search = run(fetch())
+    assert bus['id'] == bus_id
+    assert not INTERNAL_BUS_FIELDS & bus.keys()
+    assert [item['id'] for item in search['items']] == [bus_id]
+    assert not INTERNAL_BUS_FIELDS & search['items'][0].keys()
@@ -0,0 +1,49 @@
+import re
+
+from bson.regex import Regex
+
+import server
+
+
+def test_query_shape_replaces_values_with_types():
+    query = {"route_from_key": {"$regex": "^sao"}, "seats": {"$in": [1, 2, 3]}, "$or": [{"status": "pending"}, {"total": 1.5}]}
+    assert server.query_shape(query) == {
+        "route_from_key": {"$regex": "str"}, "seats": {"$in": ["int"]}, "$or": [{"status": "str"}, {"total": "float"}]
+    }
+    assert server.query_shape({"name": re.compile("^a")}) == {"name": "regex"}
+    assert server.query_shape({"name": Regex("^a")}) == {"name": "regex"}
+    assert server.query_shape({"seats": []}) == {"seats": []}
+
+
+def test_command_shape_by_command():
+    assert server.command_shape({"find": "buses", "filter": {"id": "bus-1"}, "sort": {"departure_at": 1}}) == {
+        "filter": {"id": "str"}, "sort": {"departure_at": 1}
+    }
+    assert server.command_shape({"update": "bookings", "updates": [{"q": {"id": "b"}, "u": {"$set": {"status": "x"}}}]}) == {
+        "filter": {"id": "str"}
+    }
+    assert server.command_shape({"delete": "buses", "deletes": [{"q": {"id": "b"}, "limit": 1}]}) == {"filter": {"id": "str"}}
+    assert server.command_shape({"aggregate": "bookings", "pipeline": [{"$match": {"status": "confirmed"}}, {"$group": {"_id": "$bus_id"}}]}) == {
+        "pipeline": [{"$match": {"status": "str"}}, {"$group": "..."}]
+    }
+
+
+def test_plan_stages_flatten_root_first():
+    plan = {
+        "stage": "FETCH",
+        "inputStage": {
+            "stage": "OR",
+            "inputStages": [
+                {"stage": "IXSCAN", "indexName": "departure_at_1"},
+                {"stage": "COLLSCAN"}
+            ]
+        }
+    }
+    assert server.plan_stages(plan) == ["FETCH", "OR", "IXSCAN(departure_at_1)", "COLLSCAN"]
+    # Slot-based plans wrap the classic tree in queryPlan
+    assert server.plan_stages({"queryPlan": {"stage": "IXSCAN", "indexName": "id_1"}}) == ["IXSCAN(id_1)"]
+
+
+def test_winning_plans_found_in_aggregate_explains():
+    explain = {"stages": [{"$cursor": {"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}}}, {"$group": {}}]}
+    assert server.winning_plans(explain) == [{"stage": "COLLSCAN"}]
@@ -0,0 +1,49 @@
+import asyncio
+
+import server
+
+BOOKING = {"bus_id": "bus-1", "id": "booking-1"}
+
+
+def disk_files(directory):
+    return sorted(path.name for path in directory.iterdir())
+
+
+def test_new_fingerprint_replaces_the_old_file(tmp_path):
+    cache = server.TicketCache(10, tmp_path, 1000)
+    asyncio.run(cache.put(BOOKING, "aaa", b"x" * 100))
+    asyncio.run(cache.put(BOOKING, "bbb", b"x" * 100))
+    assert disk_files(tmp_path) == ["bus-1-booking-1-bbb.pdf"]
+    assert cache.disk_bytes == 100
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    cache = server.TicketCache(10, tmp_path, 250)
+    asyncio.run(cache.put(BOOKING, "aaa", b"x" * 100))
+    asyncio.run(cache.put({"bus_id": "bus-1", "id": "booking-2"}, "bbb", b"y" * 100))
+    # Reading booking-1 back from disk makes booking-2 the oldest
+    assert asyncio.run(cache.get(BOOKING, "aaa")) == b"x" * 100
+    asyncio.run(cache.put({"bus_id": "bus-2", "id": "booking-3"}, "ccc", b"z" * 100))
+    assert disk_files(tmp_path) == ["bus-1-booking-1-aaa.pdf", "bus-2-booking-3-ccc.pdf"]
+    assert cache.disk_bytes == 200
+    assert cache.stats()['disk_hits'] == 1
+
+
+def test_restart_reloads_the_index_within_the_cap(tmp_path):
+    cache = server.TicketCache(10, tmp_path, 1000)
+    for n in range(3):
+        asyncio.run(cache.put({"bus_id": "bus-1", "id": f"booking-{n}"}, "aaa", b"x" * 100))
+
+    restarted = server.TicketCache(10, tmp_path, 150)
+    assert restarted.disk_bytes == 100
+    assert len(disk_files(tmp_path)) == 1
+
+
+def test_invalidate_removes_a_bus_from_disk(tmp_path):
+    cache = server.TicketCache(10, tmp_path, 1000)
+    asyncio.run(cache.put(BOOKING, "aaa", b"x" * 100))
+    asyncio.run(cache.put({"bus_id": "bus-2", "id": "booking-2"}, "bbb", b"y" * 100))
+    cache.invalidate("bus-1")
+    assert disk_files(tmp_path) == ["bus-2-booking-2-bbb.pdf"]
+    assert cache.disk_bytes == 100
+    assert asyncio.run(cache.get(BOOKING, "aaa")) is None
@@ -0,0 +1,56 @@
+import uuid
+from types import SimpleNamespace
+
+import server
+
+
+def test_webhook_duplicate_is_acknowledged_once(run, monkeypatch, api_client):
+    event = SimpleNamespace(
+        event_id=f"evt_{uuid.uuid4().hex}", event_type="checkout.session.completed",
+        session_id=f"cs_{uuid.uuid4().hex}", payment_status="paid", metadata={"booking_id": "booking-1"}
+    )
+    enqueued = []
+
+    async def handle_webhook(body, signature):
+        return event
+
+    async def enqueue(*jobs, key=None):
+        enqueued.append((jobs, key))
+
+    monkeypatch.setattr(server.payments, "handle_webhook", handle_webhook)
+    monkeypatch.setattr(server.job_queue, "enqueue", enqueue)
+
+    async def deliver_twice():
+        async with api_client() as client:
+            return [(await client.post("/api/webhook/stripe", content=b"{}")).json() for _ in range(2)]
+
+    assert run(deliver_twice()) == [{"status": "success"}, {"status": "duplicate"}]
+    assert len(enqueued) == 1
+    assert enqueued[0][1] == "booking-1"
+    assert run(server.db.stripe_events.count_documents({"event_id": event.event_id})) == 1
+
+
+def test_webhook_retry_after_failed_enqueue_is_not_a_duplicate(run, monkeypatch, api_client):
+    event = SimpleNamespace(
+        event_id=f"evt_{uuid.uuid4().hex}", event_type="checkout.session.completed",
+        session_id=f"cs_{uuid.uuid4().hex}", payment_status="paid", metadata={}
+    )
+    attempts = []
+
+    async def handle_webhook(body, signature):
+        return event
+
+    async def enqueue(*jobs, key=None):
+        attempts.append(key)
+        if len(attempts) == 1:
+            raise RuntimeError("queue unavailable")
+
+    monkeypatch.setattr(server.payments, "handle_webhook", handle_webhook)
+    monkeypatch.setattr(server.job_queue, "enqueue", enqueue)
+
+    async def deliver_twice():
+        async with api_client(raise_app_exceptions=False) as client:
+            return [(await client.post("/api/webhook/stripe", content=b"{}")).status_code for _ in range(2)]
+
+    assert run(deliver_twice()) == [500, 200]
+    assert attempts == [event.session_id, event.session_id]